@@ -0,0 +1,155 @@
+import os
+import logging
+
+import dead_letter
+import hub
+import hubspot_api
+import prem
+from models import parse_premises
+
+# Association sync between tickets, contacts and premises objects. The links each
+# premise implies (its contact's tickets, the premises object and its contact, the
+# premises object and its tickets) are computed from the records and HubSpot IDs
+# resolved by the push, diffed against the links HubSpot already has (read through the
+# v4 batch read endpoint) and only the missing ones are created in batches. Links are
+# never removed.
+
+# Inputs per v4 association batch read/create request
+ASSOCIATION_BATCH_SIZE = 1000
+
+# Whether run-all, the daemon and the ingest worker sync associations after each push
+SYNC_ASSOCIATIONS = os.getenv('SYNC_ASSOCIATIONS', '1') == '1'
+
+# Association type used per (from, to) object type pair. None creates HubSpot's default
+# (unlabeled) association, for pairs without a configured label.
+ASSOCIATION_TYPES = {
+    ("tickets", "contacts"): {"associationCategory": "USER_DEFINED", "associationTypeId": 81},
+    (prem.PREMISES_OBJECT_API_NAME, "contacts"): None,
+    (prem.PREMISES_OBJECT_API_NAME, "tickets"): None,
+}
+
+# Work out the links the premises imply, using the HubSpot IDs cached by the push.
+# Returns ({(from type, to type): set of (from ID, to ID)}, number of links skipped
+# because an object has no known HubSpot ID yet).
+def desired_associations(premises):
+    desired = {pair: set() for pair in ASSOCIATION_TYPES}
+    unresolved = 0
+
+    # Premises of one customer share the contact written from their primary premise
+    contact_ids = {}
+    for customer_premises in hub.group_premises_by_customer([premise for premise in premises if hub.is_pushable(premise)]):
+        primary = hub.select_primary_premise(customer_premises)
+        contact_id = hub.contact_ids.get(f"aex_id:{primary.id}")
+        if not contact_id and primary.customer.email:
+            contact_id = hub.contact_ids.get(hub.email_key(primary.customer.email))
+        for premise in customer_premises:
+            contact_ids[str(premise.id)] = contact_id
+
+    for premise in premises:
+        premises_id = prem.premises_ids.get(str(premise.id))
+        contact_id = contact_ids.get(str(premise.id))
+
+        links = [((prem.PREMISES_OBJECT_API_NAME, "contacts"), premises_id, contact_id)]
+        for service in premise.services or ():
+            for work_order in service.work_orders:
+                ticket_id = hub.ticket_ids.get(str(work_order.id))
+                if ticket_id is None:
+                    continue  # No ticket is synced for this work order
+                links.append((("tickets", "contacts"), ticket_id, contact_id))
+                links.append(((prem.PREMISES_OBJECT_API_NAME, "tickets"), premises_id, ticket_id))
+
+        for pair, from_id, to_id in links:
+            if from_id and to_id:
+                desired[pair].add((str(from_id), str(to_id)))
+            else:
+                unresolved += 1
+
+    return desired, unresolved
+
+# Read the existing links from a set of objects. Returns {from ID: {to ID: set of type IDs}}.
+def read_associations(from_type, to_type, from_ids, headers, batch_size=ASSOCIATION_BATCH_SIZE):
+    url = f"{hubspot_api.BASE_URL}/crm/v4/associations/{from_type}/{to_type}/batch/read"
+    from_ids = sorted(from_ids)
+    existing = {}
+    for start in range(0, len(from_ids), batch_size):
+        chunk = from_ids[start:start + batch_size]
+        response = dead_letter.send_with_backoff("POST", url, headers, {"inputs": [{"id": from_id} for from_id in chunk]}, base_delay=1.0)
+        if response is None or response.status_code not in (200, 207):
+            raise Exception(f"Error reading {from_type} to {to_type} associations: {response.text if response is not None else 'No response'}")
+
+        for result in response.json().get('results', []):
+            links = existing.setdefault(str(result['from']['id']), {})
+            for target in result.get('to', []):
+                links.setdefault(str(target['toObjectId']), set()).update(
+                    association_type.get('typeId') for association_type in target.get('associationTypes', [])
+                )
+    return existing
+
+# The desired links HubSpot does not have yet (with the configured type, if one is set)
+def missing_associations(desired, existing, association_type):
+    missing = []
+    for from_id, to_id in sorted(desired):
+        type_ids = existing.get(from_id, {}).get(to_id)
+        if type_ids is None:
+            missing.append((from_id, to_id))
+        elif association_type and association_type["associationTypeId"] not in type_ids:
+            missing.append((from_id, to_id))
+    return missing
+
+def _association_input(from_id, to_id, association_type):
+    association = {"from": {"id": from_id}, "to": {"id": to_id}}
+    if association_type:
+        association["types"] = [association_type]
+    return association
+
+# Create links in batches; returns how many were created
+def create_associations(from_type, to_type, pairs, association_type, headers, batch_size=ASSOCIATION_BATCH_SIZE):
+    operation = "create" if association_type else "associate/default"
+    url = f"{hubspot_api.BASE_URL}/crm/v4/associations/{from_type}/{to_type}/batch/{operation}"
+
+    created = 0
+    for start in range(0, len(pairs), batch_size):
+        chunk = pairs[start:start + batch_size]
+        inputs = [_association_input(from_id, to_id, association_type) for from_id, to_id in chunk]
+        response = dead_letter.send_with_backoff("POST", url, headers, {"inputs": inputs}, base_delay=1.0)
+        if response is not None and response.status_code in (200, 201):
+            created += len(chunk)
+        elif response is not None and response.status_code == 207:
+            created += len(chunk) - len(response.json().get('errors', []))
+            logging.error(f"Some {from_type} to {to_type} associations failed: {response.text}")
+        else:
+            # Missing links are found again by the next sync, so nothing needs to be kept
+            logging.error(f"Error creating {from_type} to {to_type} associations: {response.text if response is not None else 'No response'}")
+    return created
+
+# Fill the HubSpot ID caches for every object by listing their AEX keys, for when the
+# association sync runs without a push in the same process
+def load_hubspot_ids(headers):
+    import reconcile
+    for object_type, key_property in reconcile.OBJECT_KEYS.items():
+        properties = [key_property, 'email'] if object_type == 'contacts' else [key_property]
+        for object_id, values in reconcile.list_all_objects(object_type, properties, headers).items():
+            if values.get(key_property) not in (None, ''):
+                reconcile.remember_id(object_type, str(values[key_property]), object_id, values)
+
+# Create the ticket/contact/premises links the premises imply and HubSpot is missing.
+# Returns a summary per (from, to) pair.
+def sync_associations(premises_data, headers=None, dry_run=False, batch_size=ASSOCIATION_BATCH_SIZE):
+    headers = headers or hub.get_hubspot_headers()
+    desired, unresolved = desired_associations(parse_premises(premises_data))
+    if unresolved:
+        logging.info(f"Skipped {unresolved} associations whose objects have no known HubSpot ID.")
+
+    summary = {}
+    for (from_type, to_type), pairs in desired.items():
+        existing = read_associations(from_type, to_type, {from_id for from_id, _ in pairs}, headers, batch_size)
+        association_type = ASSOCIATION_TYPES[(from_type, to_type)]
+        missing = missing_associations(pairs, existing, association_type)
+
+        summary[f"{from_type}->{to_type}"] = {
+            "desired": len(pairs),
+            "missing": len(missing),
+            "created": 0 if dry_run else create_associations(from_type, to_type, missing, association_type, headers, batch_size),
+        }
+        logging.info(f"Associations {from_type} -> {to_type}: {summary[f'{from_type}->{to_type}']}")
+    return summary
@@ -0,0 +1,174 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+import contextlib
+import io
+from datetime import datetime
+
+# Allow running as "python benchmarks/bench.py" as well as "python -m benchmarks.bench"
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data
+import hub
+import prem
+import models
+import dates
+from benchmarks.synthetic import generate_snapshot
+
+# Microbenchmarks for the CPU-bound hot paths of the pipeline. Runs fully offline on a
+# synthetic snapshot and appends each run to results.jsonl so results can be tracked over time.
+
+RESULTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results.jsonl")
+
+# Time a call several times and return the individual durations in seconds
+def time_call(func, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+# Build the list of (name, item count, callable) benchmark cases for a snapshot
+def collect_cases(snapshot, snapshot_file, sales_rep_data):
+    premises = models.parse_premises(snapshot)
+    work_orders = [
+        (premise, work_order)
+        for premise in premises
+        for service in premise.services
+        for work_order in service.work_orders
+    ]
+    pipelines = [(premise, work_order, hub.get_ticket_pipeline(work_order)) for premise, work_order in work_orders]
+    ticketed = [(premise, work_order, pipeline) for premise, work_order, pipeline in pipelines if pipeline]
+    date_strings = [
+        work_order[field]
+        for premise in snapshot
+        for service in premise['services']
+        for work_order in service['work_orders']['items']
+        for field in ('created_at', 'updated_at', 'schedule_date', 'completed_date')
+        if work_order.get(field)
+    ]
+    sales_rep_ids = [premise.customer.sales_channel_id for premise in premises]
+
+    def save_snapshot():
+        with contextlib.redirect_stdout(io.StringIO()):
+            data.save_data_to_file(snapshot, snapshot_file)
+
+    return [
+        ("save_data_to_file", len(snapshot), save_snapshot),
+        ("load_enriched_data", len(snapshot), lambda: hub.load_enriched_data(snapshot_file)),
+        ("parse_premises", len(snapshot), lambda: models.parse_premises(snapshot)),
+        ("normalize_date (uncached)", len(date_strings), lambda: [dates.normalize_date.__wrapped__(value) for value in date_strings]),
+        ("build_contact_data", len(premises),
+         lambda: [hub.build_contact_data(premise, premise.customer) for premise in premises]),
+        ("build_premises_properties", len(premises),
+         lambda: [prem.build_premises_properties(premise) for premise in premises]),
+        ("get_ticket_pipeline", len(work_orders),
+         lambda: [hub.get_ticket_pipeline(work_order) for _, work_order in work_orders]),
+        ("build_ticket_properties", len(ticketed),
+         lambda: [hub.build_ticket_properties(work_order, premise, premise.customer, sales_rep_data, pipeline)
+                  for premise, work_order, pipeline in ticketed]),
+        ("lookup_sales_rep", len(sales_rep_ids),
+         lambda: [hub.lookup_sales_rep(sales_rep_data, sales_rep_id) for sales_rep_id in sales_rep_ids]),
+        ("format_date", len(date_strings), lambda: [hub.format_date(value) for value in date_strings]),
+        ("format_date_to_timestamp", len(date_strings), lambda: [hub.format_date_to_timestamp(value) for value in date_strings]),
+        ("format_date_to_unix", len(date_strings), lambda: [hub.format_date_to_unix(value) for value in date_strings]),
+    ]
+
+# Return the current git commit, if available, so results can be tied to a change
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Find the most recent earlier run with the same snapshot parameters
+def load_previous_run(params, filename=RESULTS_FILE):
+    if not os.path.exists(filename):
+        return None
+    previous = None
+    with open(filename, 'r') as results_file:
+        for line in results_file:
+            run = json.loads(line)
+            if run.get('params') == params:
+                previous = run
+    return previous
+
+def append_run(run, filename=RESULTS_FILE):
+    with open(filename, 'a') as results_file:
+        results_file.write(json.dumps(run) + "\n")
+
+def run_benchmarks(params, repeat):
+    snapshot = generate_snapshot(**params)
+    sales_rep_data = hub.load_sales_rep_data(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "id.csv"))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        snapshot_file = os.path.join(tmp_dir, "enriched_premises_data.json")
+        cases = collect_cases(snapshot, snapshot_file, sales_rep_data)
+        for name, items, func in cases:
+            durations = time_call(func, repeat)
+            best = min(durations)
+            results[name] = {
+                "items": items,
+                "best_ms": best * 1000,
+                "median_ms": statistics.median(durations) * 1000,
+                "us_per_item": best * 1e6 / items if items else None,
+            }
+    return results
+
+def print_results(results, previous=None):
+    print(f"{'case':<28}{'items':>9}{'best ms':>12}{'median ms':>12}{'us/item':>10}{'vs prev':>10}")
+    for name, result in results.items():
+        change = ''
+        if previous and name in previous.get('results', {}):
+            previous_best = previous['results'][name]['best_ms']
+            if previous_best:
+                change = f"{result['best_ms'] / previous_best:.2f}x"
+        us_per_item = f"{result['us_per_item']:.2f}" if result['us_per_item'] is not None else '-'
+        print(f"{name:<28}{result['items']:>9}{result['best_ms']:>12.2f}{result['median_ms']:>12.2f}{us_per_item:>10}{change:>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline microbenchmarks for the premise sync hot paths.")
+    parser.add_argument("--premises", type=int, default=1000)
+    parser.add_argument("--services-per-premise", type=int, default=2)
+    parser.add_argument("--work-orders-per-service", type=int, default=3)
+    parser.add_argument("--shared-customer-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--no-save", action="store_true", help="Do not append this run to results.jsonl")
+    args = parser.parse_args(argv)
+
+    # The payload builders log every skipped work order; keep that out of the timings
+    logging.disable(logging.CRITICAL)
+
+    params = {
+        "premises": args.premises,
+        "services_per_premise": args.services_per_premise,
+        "work_orders_per_service": args.work_orders_per_service,
+        "shared_customer_ratio": args.shared_customer_ratio,
+        "seed": args.seed,
+    }
+    results = run_benchmarks(params, args.repeat)
+    previous = load_previous_run(params)
+    print_results(results, previous)
+
+    if not args.no_save:
+        append_run({
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "commit": get_git_commit(),
+            "params": params,
+            "repeat": args.repeat,
+            "results": results,
+        })
+
+if __name__ == "__main__":
+    main()
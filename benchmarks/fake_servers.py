@@ -0,0 +1,411 @@
+import re
+import json
+import time
+import random
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-ins for the AEX endpoints data.py uses and the HubSpot CRM v3 endpoints
+# hub.py and prem.py use. Both run in-process on ephemeral ports with configurable
+# latency, error rate and 429 rate limiting, and record every call they serve.
+#
+# The fake AEX treats every record as recently updated, so 'updated_after' filters
+# always match and synthetic snapshots with old dates are still returned.
+
+
+class FaultConfig:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_limit_per_sec=None, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_limit_per_sec = rate_limit_per_sec
+        self.random = random.Random(seed)
+
+
+class CallStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = defaultdict(int)
+        self.statuses = defaultdict(int)
+        self.latencies = []
+
+    def record(self, endpoint, status, latency):
+        with self.lock:
+            self.calls[endpoint] += 1
+            self.statuses[status] += 1
+            self.latencies.append(latency)
+
+    @property
+    def total(self):
+        return sum(self.calls.values())
+
+
+# Sliding one-second window limiter; requests over the limit get a 429
+class RateLimiter:
+    def __init__(self, per_second):
+        self.per_second = per_second
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.count = 0
+
+    def allow(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1.0:
+                self.window_start = now
+                self.count = 0
+            self.count += 1
+            return self.count <= self.per_second
+
+
+class FakeApiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, routes, faults=None):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.routes = [(method, re.compile(pattern + r"$"), name, handler) for method, pattern, name, handler in routes]
+        self.faults = faults or FaultConfig()
+        self.stats = CallStats()
+        self.limiter = RateLimiter(self.faults.rate_limit_per_sec) if self.faults.rate_limit_per_sec else None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately; without this, keep-alive clients stall
+    # on Nagle's algorithm plus delayed ACKs for ~40ms per call
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method):
+        started = time.perf_counter()
+        server = self.server
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+
+        endpoint, status, payload = f"{method} (unmatched)", 404, {"message": "Not found"}
+        for route_method, pattern, name, handler in server.routes:
+            match = pattern.match(parsed.path)
+            if route_method == method and match:
+                endpoint = f"{method} {name}"
+                faults = server.faults
+                delay = faults.latency_ms + (faults.random.uniform(-faults.jitter_ms, faults.jitter_ms) if faults.jitter_ms else 0)
+                if delay > 0:
+                    time.sleep(delay / 1000)
+
+                if server.limiter and not server.limiter.allow():
+                    status, payload = 429, {"status": "error", "message": "You have reached your secondly limit."}
+                elif faults.error_rate and faults.random.random() < faults.error_rate:
+                    status, payload = 500, {"status": "error", "message": "Injected failure"}
+                else:
+                    status, payload = handler(*match.groups(), query=query, body=body)
+                break
+
+        encoded = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+        server.stats.record(endpoint, status, time.perf_counter() - started)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+
+# Return one page of items in the {"items", "total"} shape AEX uses
+# (per_page is honoured up to max_page_size, like the real API)
+def _page(items, query, page_size, max_page_size=200):
+    page = int(query.get('page', 1))
+    page_size = min(int(query.get('per_page', page_size)), max_page_size)
+    start = (page - 1) * page_size
+    return {"items": items[start:start + page_size], "total": len(items), "page": page}
+
+
+class FakeAex:
+    def __init__(self, snapshot, page_size=50):
+        self.page_size = page_size
+        self.premises = []
+        self.premises_by_id = {}
+        self.services_by_premise = defaultdict(list)
+        self.full_services = {}
+        self.work_orders = []
+        self.work_orders_by_service = defaultdict(list)
+        self.customers = {}
+
+        # Split an enriched snapshot back into the raw resources AEX serves
+        for enriched in snapshot:
+            premise = {key: value for key, value in enriched.items() if key not in ('services', 'customer')}
+            self.premises.append(premise)
+            self.premises_by_id[str(premise['id'])] = premise
+            self.customers[str(premise['customer_id'])] = enriched['customer']
+            for service in enriched['services']:
+                details = service['service_details']
+                service_id = details['full_service']['service']['id']
+                self.services_by_premise[str(premise['id'])].append({"id": service_id, "premise_id": premise['id']})
+                self.full_services[str(service_id)] = details
+                for work_order in service['work_orders']['items']:
+                    self.work_orders.append(work_order)
+                    self.work_orders_by_service[str(service_id)].append(work_order)
+
+    def routes(self):
+        return [
+            ("GET", r"/premises", "/premises", self.list_premises),
+            ("GET", r"/premises/(\w+)", "/premises/{id}", self.get_premise),
+            ("GET", r"/services", "/services", self.list_services),
+            ("GET", r"/services/(\w+)/full", "/services/{id}/full", self.get_full_service),
+            ("GET", r"/work-orders", "/work-orders", self.list_work_orders),
+            ("GET", r"/customers/(\w+)", "/customers/{id}", self.get_customer),
+            ("GET", r"/customers/(\w+)/services", "/customers/{id}/services", self.get_customer_services),
+        ]
+
+    def list_premises(self, query, body):
+        return 200, _page(self.premises, query, self.page_size)
+
+    def get_premise(self, premise_id, query, body):
+        premise = self.premises_by_id.get(premise_id)
+        return (200, premise) if premise else (404, {"message": "Premise not found"})
+
+    def list_services(self, query, body):
+        services = self.services_by_premise.get(query.get('premise', ''), [])
+        return 200, {"items": services, "total": len(services)}
+
+    def get_full_service(self, service_id, query, body):
+        details = self.full_services.get(service_id)
+        return (200, details) if details else (404, {"message": "Service not found"})
+
+    def list_work_orders(self, query, body):
+        items = self.work_orders_by_service.get(query['service'], []) if 'service' in query else self.work_orders
+        if query.get('status'):
+            wanted = set(query['status'].lower().split(','))
+            items = [item for item in items if (item.get('status') or '').lower() in wanted]
+        if query.get('status_not'):
+            excluded = set(query['status_not'].lower().split(','))
+            items = [item for item in items if (item.get('status') or '').lower() not in excluded]
+        if 'service' in query:
+            return 200, {"items": items, "total": len(items)}
+        return 200, _page(items, query, self.page_size)
+
+    def get_customer(self, customer_id, query, body):
+        customer = self.customers.get(customer_id)
+        return (200, customer['customer_details']) if customer else (404, {"message": "Customer not found"})
+
+    def get_customer_services(self, customer_id, query, body):
+        customer = self.customers.get(customer_id)
+        return (200, customer['customer_services']) if customer else (404, {"message": "Customer not found"})
+
+
+class FakeHubSpot:
+    def __init__(self, list_limit=100):
+        self.lock = threading.Lock()
+        self.list_limit = list_limit
+        self.objects = defaultdict(dict)  # object type -> id -> properties
+        self.index = defaultdict(lambda: defaultdict(set))  # (object type, property) -> value -> ids
+        self.associations = defaultdict(lambda: defaultdict(dict))  # (from type, to type) -> from id -> to id -> type ids
+        self.next_id = 1
+
+    def routes(self):
+        objects = r"/crm/v3/objects/([\w-]+)"
+        return [
+            ("POST", objects + r"/search", "/crm/v3/objects/{type}/search", self.search),
+            ("POST", objects + r"/batch/read", "/crm/v3/objects/{type}/batch/read", self.batch_read),
+            ("POST", objects + r"/batch/create", "/crm/v3/objects/{type}/batch/create", self.batch_create),
+            ("POST", objects + r"/batch/update", "/crm/v3/objects/{type}/batch/update", self.batch_update),
+            ("POST", r"/crm/v4/associations/([\w-]+)/([\w-]+)/batch/read", "/crm/v4/associations/{from}/{to}/batch/read", self.read_associations),
+            ("POST", r"/crm/v4/associations/([\w-]+)/([\w-]+)/batch/create", "/crm/v4/associations/{from}/{to}/batch/create", self.create_associations),
+            ("POST", r"/crm/v4/associations/([\w-]+)/([\w-]+)/batch/associate/default", "/crm/v4/associations/{from}/{to}/batch/associate/default", self.create_default_associations),
+            ("GET", objects, "/crm/v3/objects/{type}", self.list_objects),
+            ("POST", objects, "/crm/v3/objects/{type}", self.create),
+            ("PATCH", objects + r"/(\w+)", "/crm/v3/objects/{type}/{id}", self.update),
+        ]
+
+    def _stringify(self, properties):
+        return {name: "" if value is None else str(value) for name, value in (properties or {}).items()}
+
+    def _set_properties(self, object_type, object_id, properties):
+        stored = self.objects[object_type].setdefault(object_id, {"hs_object_id": object_id})
+        for name, value in self._stringify(properties).items():
+            if object_type == 'contacts' and name == 'email':
+                value = value.strip().lower()  # HubSpot stores contact emails lowercased
+            old = stored.get(name)
+            if old is not None:
+                self.index[(object_type, name)][old].discard(object_id)
+            stored[name] = value
+            self.index[(object_type, name)][value].add(object_id)
+        return stored
+
+    def _result(self, object_id, properties, wanted=None):
+        if wanted:
+            properties = {name: properties.get(name) for name in wanted}
+        return {"id": object_id, "properties": properties}
+
+    # Associations are stored in both directions, as HubSpot reports them from either side
+    def _associate(self, from_type, from_id, to_type, to_id, type_id):
+        self.associations[(from_type, to_type)][str(from_id)].setdefault(str(to_id), set()).add(type_id)
+        self.associations[(to_type, from_type)][str(to_id)].setdefault(str(from_id), set()).add(type_id)
+
+    def _create_one(self, object_type, properties, associations=None):
+        email = (properties or {}).get('email')
+        if object_type == 'contacts' and email:
+            existing = self.index[('contacts', 'email')].get(str(email).strip().lower())
+            if existing:
+                return 409, {"status": "error", "message": f"Contact already exists. Existing ID: {next(iter(existing))}"}
+        object_id = str(self.next_id)
+        self.next_id += 1
+        # Inline associations on create; the fake only links tickets, so the target type is assumed
+        for association in associations or []:
+            for association_type in association.get('types', []):
+                self._associate(object_type, object_id, "contacts", association['to']['id'], association_type.get('associationTypeId'))
+        return 201, self._result(object_id, dict(self._set_properties(object_type, object_id, properties)))
+
+    def search(self, object_type, query, body):
+        body = body or {}
+        with self.lock:
+            matches = []
+            for group in body.get('filterGroups', []):
+                ids = None
+                for search_filter in group.get('filters', []):
+                    if search_filter.get('operator') == 'EQ':
+                        values = [search_filter.get('value')]
+                    elif search_filter.get('operator') == 'IN':
+                        values = search_filter.get('values', [])
+                    else:
+                        continue
+                    index = self.index[(object_type, search_filter['propertyName'])]
+                    found = set().union(*(index.get(str(value), set()) for value in values))
+                    ids = set(found) if ids is None else ids & found
+                for object_id in sorted(ids or ()):
+                    if object_id not in matches:
+                        matches.append(object_id)
+            results = [self._result(object_id, self.objects[object_type][object_id], body.get('properties')) for object_id in matches]
+        return 200, {"total": len(results), "results": results[:body.get('limit', 10)]}
+
+    def create(self, object_type, query, body):
+        with self.lock:
+            return self._create_one(object_type, (body or {}).get('properties'), (body or {}).get('associations'))
+
+    def update(self, object_type, object_id, query, body):
+        with self.lock:
+            if object_id not in self.objects[object_type]:
+                return 404, {"status": "error", "message": f"Object {object_id} not found"}
+            return 200, self._result(object_id, dict(self._set_properties(object_type, object_id, (body or {}).get('properties'))))
+
+    def list_objects(self, object_type, query, body):
+        limit = min(int(query.get('limit', 10)), self.list_limit)
+        wanted = query.get('properties', '').split(',') if query.get('properties') else None
+        with self.lock:
+            ids = sorted(self.objects[object_type], key=int)
+            start = 0
+            if query.get('after'):
+                start = next((position for position, object_id in enumerate(ids) if int(object_id) > int(query['after'])), len(ids))
+            page = ids[start:start + limit]
+            results = [self._result(object_id, self.objects[object_type][object_id], wanted) for object_id in page]
+        payload = {"results": results}
+        if start + limit < len(ids):
+            payload["paging"] = {"next": {"after": page[-1]}}
+        return 200, payload
+
+    def batch_read(self, object_type, query, body):
+        body = body or {}
+        with self.lock:
+            results = [
+                self._result(item['id'], self.objects[object_type][item['id']], body.get('properties'))
+                for item in body.get('inputs', [])
+                if item['id'] in self.objects[object_type]
+            ]
+        return 200, {"status": "COMPLETE", "results": results}
+
+    def batch_create(self, object_type, query, body):
+        results, errors = [], []
+        with self.lock:
+            for item in (body or {}).get('inputs', []):
+                status, payload = self._create_one(object_type, item.get('properties'), item.get('associations'))
+                (results if status == 201 else errors).append(payload)
+        return (201 if not errors else 207), {"status": "COMPLETE", "results": results, "errors": errors}
+
+    def batch_update(self, object_type, query, body):
+        results, errors = [], []
+        with self.lock:
+            for item in (body or {}).get('inputs', []):
+                object_id = str(item.get('id'))
+                if object_id in self.objects[object_type]:
+                    results.append(self._result(object_id, dict(self._set_properties(object_type, object_id, item.get('properties')))))
+                else:
+                    errors.append({"status": "error", "message": f"Object {object_id} not found", "context": {"ids": [object_id]}})
+        return (200 if not errors else 207), {"status": "COMPLETE", "results": results, "errors": errors}
+
+    def read_associations(self, from_type, to_type, query, body):
+        with self.lock:
+            links = self.associations[(from_type, to_type)]
+            results = [
+                {
+                    "from": {"id": item['id']},
+                    "to": [
+                        {"toObjectId": int(to_id), "associationTypes": [{"typeId": type_id} for type_id in sorted(type_ids, key=str)]}
+                        for to_id, type_ids in links[str(item['id'])].items()
+                    ],
+                }
+                for item in (body or {}).get('inputs', [])
+                if links.get(str(item['id']))
+            ]
+        return 200, {"status": "COMPLETE", "results": results}
+
+    def create_associations(self, from_type, to_type, query, body):
+        with self.lock:
+            inputs = (body or {}).get('inputs', [])
+            for item in inputs:
+                for association_type in item.get('types', []):
+                    self._associate(from_type, item['from']['id'], to_type, item['to']['id'], association_type.get('associationTypeId'))
+        return 201, {"status": "COMPLETE", "results": inputs}
+
+    def create_default_associations(self, from_type, to_type, query, body):
+        with self.lock:
+            inputs = (body or {}).get('inputs', [])
+            for item in inputs:
+                self._associate(from_type, item['from']['id'], to_type, item['to']['id'], None)
+        return 200, {"status": "COMPLETE", "results": inputs}
+
+
+# Start a fake AEX server seeded from an enriched snapshot
+def start_fake_aex(snapshot, faults=None, page_size=50):
+    aex = FakeAex(snapshot, page_size=page_size)
+    server = FakeApiServer(aex.routes(), faults).start()
+    server.api = aex
+    return server
+
+# Start an empty fake HubSpot server
+def start_fake_hubspot(faults=None):
+    hubspot = FakeHubSpot()
+    server = FakeApiServer(hubspot.routes(), faults).start()
+    server.api = hubspot
+    return server
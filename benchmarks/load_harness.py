@@ -0,0 +1,128 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import contextlib
+
+# Allow running as "python benchmarks/load_harness.py" as well as "python -m benchmarks.load_harness"
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import data
+import hub
+import prem
+import models
+import hubspot_api
+import associations
+from benchmarks.synthetic import generate_snapshot
+from benchmarks.fake_servers import CallStats, FaultConfig, start_fake_aex, start_fake_hubspot
+
+# End-to-end load harness: runs data.py, hub.py and prem.py against local fake AEX and
+# HubSpot servers and reports throughput, calls per premise and request tail latency.
+
+REFERENCE_FILES = ["id.csv", "ticket_types.json"]
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# Point the pipeline modules at the fake servers
+def configure_pipeline(aex_url, hubspot_url):
+    os.environ.setdefault('API_TOKEN', 'load-test')
+    os.environ.setdefault('HUBSPOT_ACCESS_TOKEN', 'load-test')
+    data.BASE_URL = aex_url
+    hubspot_api.BASE_URL = hubspot_url
+
+# Run the whole flow once in this process and return the stage timings
+def run_pipeline(hours):
+    timings = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        enriched_data = models.parse_premises(data.main(hours))
+        timings['fetch'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        hub.process_premises_for_hubspot(enriched_data)
+        timings['push-contacts'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        prem.process_premises(enriched_data)
+        timings['push-premises'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        associations.sync_associations(enriched_data)
+        timings['associations'] = time.perf_counter() - start
+    return len(enriched_data), timings
+
+def report(run, premises, timings, servers):
+    total_time = sum(timings.values())
+    print(f"\nRun {run}: {premises} premises in {total_time:.2f}s ({premises / total_time if total_time else 0:.1f} premises/sec)")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<16}{seconds:>8.2f}s")
+
+    for name, server in servers.items():
+        stats = server.stats
+        latencies_ms = [latency * 1000 for latency in stats.latencies]
+        per_premise = stats.total / premises if premises else 0
+        print(f"  {name}: {stats.total} calls ({per_premise:.2f}/premise), "
+              f"p50 {percentile(latencies_ms, 0.50):.1f}ms, p95 {percentile(latencies_ms, 0.95):.1f}ms, "
+              f"p99 {percentile(latencies_ms, 0.99):.1f}ms, statuses {dict(stats.statuses)}")
+        for endpoint, count in sorted(stats.calls.items(), key=lambda item: -item[1]):
+            print(f"    {count:>8}  {endpoint}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end load test against local fake AEX and HubSpot servers.")
+    parser.add_argument("--premises", type=int, default=200)
+    parser.add_argument("--services-per-premise", type=int, default=2)
+    parser.add_argument("--work-orders-per-service", type=int, default=3)
+    parser.add_argument("--shared-customer-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--runs", type=int, default=2, help="Later runs measure the steady state against existing records")
+    parser.add_argument("--aex-latency-ms", type=float, default=0.0)
+    parser.add_argument("--hubspot-latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls failing with a 500")
+    parser.add_argument("--hubspot-rate-limit", type=int, default=None, help="HubSpot calls per second before 429s")
+    parser.add_argument("--aex-rate-limit", type=int, default=None, help="AEX calls per second before 429s")
+    args = parser.parse_args(argv)
+
+    # Failures show up in the per-status counts; per-record log lines would drown the report
+    logging.disable(logging.ERROR)
+
+    snapshot = generate_snapshot(
+        premises=args.premises,
+        services_per_premise=args.services_per_premise,
+        work_orders_per_service=args.work_orders_per_service,
+        shared_customer_ratio=args.shared_customer_ratio,
+        seed=args.seed,
+    )
+    servers = {
+        "aex": start_fake_aex(snapshot, FaultConfig(args.aex_latency_ms, args.jitter_ms, args.error_rate, args.aex_rate_limit, args.seed)),
+        "hubspot": start_fake_hubspot(FaultConfig(args.hubspot_latency_ms, args.jitter_ms, args.error_rate, args.hubspot_rate_limit, args.seed + 1)),
+    }
+    configure_pipeline(servers["aex"].base_url, servers["hubspot"].base_url)
+
+    # Run in a scratch directory so snapshots and caches do not touch the working tree
+    working_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        for filename in REFERENCE_FILES:
+            shutil.copy(os.path.join(REPO_DIR, filename), scratch_dir)
+        os.chdir(scratch_dir)
+        try:
+            for run in range(1, args.runs + 1):
+                for server in servers.values():
+                    server.stats = CallStats()
+                premises, timings = run_pipeline(data.HOURS)
+                report(run, premises, timings, servers)
+        finally:
+            os.chdir(working_dir)
+            for server in servers.values():
+                server.stop()
+
+if __name__ == "__main__":
+    main()
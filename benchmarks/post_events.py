@@ -0,0 +1,42 @@
+import os
+import sys
+import json
+import argparse
+
+import requests
+
+# Post sample change notifications to a running ingest receiver (ingest.py)
+
+SAMPLE_EVENTS = [
+    {"type": "premise", "id": 1},
+    {"type": "service", "id": 3, "premise_id": 2},
+    {"type": "service", "id": 5},
+    {"type": "work_order", "id": 10, "service_id": 6},
+    {"type": "work_order", "id": 11, "premise_id": 1},
+]
+
+def post_events(url, events, batch=False, secret=None):
+    headers = {"X-Ingest-Secret": secret} if secret else {}
+    if batch:
+        response = requests.post(url, json=events, headers=headers)
+        print(f"{response.status_code} {response.text}")
+        return
+    for event in events:
+        response = requests.post(url, json=event, headers=headers)
+        print(f"{json.dumps(event)} -> {response.status_code} {response.text}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Post sample AEX change notifications to the ingest receiver.")
+    parser.add_argument("--url", default="http://localhost:8085/events")
+    parser.add_argument("--file", help="JSON file with a list of events to send instead of the samples")
+    parser.add_argument("--batch", action="store_true", help="Send all events in a single request")
+    args = parser.parse_args(argv)
+
+    events = SAMPLE_EVENTS
+    if args.file:
+        with open(args.file, 'r') as json_file:
+            events = json.load(json_file)
+    post_events(args.url, events, args.batch, os.getenv('INGEST_SECRET'))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import random
+from datetime import datetime, timedelta
+
+# Generate synthetic enriched premises in the same shape data.py writes to
+# enriched_premises_data.json, so the pipeline can be exercised fully offline.
+
+STREET_NAMES = ["Main St", "Oak Ave", "Church St", "Long St", "Kloof Rd", "Beach Rd", "Park Lane", "Hill St"]
+CITIES = [("Cape Town", "Western Cape"), ("Durban", "KwaZulu-Natal"), ("Pretoria", "Gauteng"), ("Johannesburg", "Gauteng")]
+PRODUCTS = ["Fibre 25/25", "Fibre 50/50", "Fibre 100/100", "Fibre 500/250", "Fibre 1000/500"]
+SALES_CHANNEL_IDS = [9, 10, 11, 15, None]
+
+# Mostly statuses hub.py maps to a pipeline stage, plus cancelled and an unknown one
+WORK_ORDER_STATUSES = [
+    "New Order", "Pre Order", "Fiber Ready", "ISP Scheduled", "ISP Complete", "NID Installation Complete",
+    "Activation Complete", "Provisioning", "Civil Drop", "Optical Drop", "Abandoned", "cancelled", "awaiting survey"
+]
+
+BASE_TIME = datetime(2024, 1, 1)
+
+# Format a datetime the way the AEX API returns it
+def _format_timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+def _random_time(rng, days=365):
+    return BASE_TIME + timedelta(seconds=rng.randrange(days * 24 * 3600))
+
+def _make_customer(rng, customer_id):
+    return {
+        "customer_details": {
+            "id": customer_id,
+            "first_name": f"First{customer_id}",
+            "last_name": f"Last{customer_id}",
+            "email": f"customer{customer_id}@example.com",
+            "mobile_number": f"08{rng.randrange(10**7, 10**8)}",
+        },
+        "customer_services": {
+            "items": [{"id": customer_id * 10, "sales_channel_id": rng.choice(SALES_CHANNEL_IDS)}],
+            "total": 1
+        }
+    }
+
+def _make_work_order(rng, work_order_id, service_id):
+    created_at = _random_time(rng)
+    completed = rng.random() < 0.5
+    return {
+        "id": work_order_id,
+        "service_id": service_id,
+        "type": rng.choice(["Installation", "Provisioning", "Change Service"]),
+        "status": rng.choice(WORK_ORDER_STATUSES),
+        "description": f"Work order {work_order_id} for service {service_id}",
+        "last_comment": "Synthetic comment",
+        "created_at": _format_timestamp(created_at),
+        "updated_at": _format_timestamp(created_at + timedelta(days=rng.randrange(30))),
+        "schedule_date": _format_timestamp(created_at + timedelta(days=rng.randrange(1, 14))),
+        "completed_date": _format_timestamp(created_at + timedelta(days=rng.randrange(14, 30))) if completed else None,
+    }
+
+def _make_service(rng, service_id, premise_id, work_order_ids, work_orders_per_service):
+    product_index = rng.randrange(len(PRODUCTS))
+    # Vary the count around the configured mean so services are not all identical
+    count = rng.randint(max(0, work_orders_per_service - 1), work_orders_per_service + 1)
+    work_orders = [_make_work_order(rng, next(work_order_ids), service_id) for _ in range(count)]
+    return {
+        "service_details": {
+            "full_service": {
+                "service": {
+                    "id": service_id,
+                    "premise_id": premise_id,
+                    "status": rng.choice(["active", "pending", "cancelled"]),
+                    "updated_at": _format_timestamp(_random_time(rng)),
+                },
+                "isp_product": {"id": product_index + 1, "name": PRODUCTS[product_index]}
+            }
+        },
+        "work_orders": {"items": work_orders, "total": len(work_orders)}
+    }
+
+# Build a list of enriched premises.
+# shared_customer_ratio is the fraction of premises that reuse an existing customer.
+def generate_snapshot(premises=1000, services_per_premise=2, work_orders_per_service=3, shared_customer_ratio=0.1, seed=0):
+    rng = random.Random(seed)
+
+    service_ids = iter(range(1, 10**9))
+    work_order_ids = iter(range(1, 10**9))
+    customers = {}
+    snapshot = []
+
+    for premise_id in range(1, premises + 1):
+        if customers and rng.random() < shared_customer_ratio:
+            customer_id = rng.choice(list(customers))
+        else:
+            customer_id = len(customers) + 1
+            customers[customer_id] = _make_customer(rng, customer_id)
+
+        city, province = rng.choice(CITIES)
+        premise = {
+            "id": premise_id,
+            "customer_id": customer_id,
+            "street_number": str(rng.randrange(1, 999)),
+            "street_name": rng.choice(STREET_NAMES),
+            "city": city,
+            "province": province,
+            "postal_code": f"{rng.randrange(1000, 9999)}",
+            "latitude": f"{rng.uniform(-34.5, -22.0):.6f}",
+            "longitude": f"{rng.uniform(16.5, 32.9):.6f}",
+            "status": rng.choice(["active", "pending", "inactive"]),
+            "updated_at": _format_timestamp(_random_time(rng)),
+        }
+        premise['services'] = [
+            _make_service(rng, next(service_ids), premise_id, work_order_ids, work_orders_per_service)
+            for _ in range(services_per_premise)
+        ]
+        premise['customer'] = customers[customer_id]
+        snapshot.append(premise)
+
+    return snapshot
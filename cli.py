@@ -0,0 +1,199 @@
+import argparse
+
+# Single entry point for the sync pipeline. The pipeline modules are imported inside
+# each subcommand so that only what a command needs is loaded, and run-all reuses
+# one process (and the enriched data in memory) for the whole flow.
+
+# Fetch and enrich premises from AEX and save the snapshot
+def run_fetch(args):
+    import data
+    data.KEEP_RAW_PAYLOADS = data.KEEP_RAW_PAYLOADS or args.keep_raw
+    if args.full:
+        # Everything reconcile needs: the whole history, cancelled work orders included
+        data.KEEP_ALL_WORK_ORDERS = True
+        return data.main(data.FULL_FETCH_HOURS if args.hours is None else args.hours)
+    return data.main(data.HOURS if args.hours is None else args.hours)
+
+# Push contacts and tickets from the enriched snapshot to HubSpot
+def run_push_contacts(args):
+    import hub
+    hub.process_premises_for_hubspot(hub.load_enriched_data(args.snapshot))
+
+# Push premises custom objects from the enriched snapshot to HubSpot
+def run_push_premises(args):
+    import prem
+    prem.process_premises(prem.load_premises_data(args.snapshot))
+
+# Fetch, then push contacts/tickets and premises without reloading the snapshot
+def run_all(args):
+    import data
+    import hub
+    import prem
+    import models
+    import associations
+
+    data.KEEP_RAW_PAYLOADS = data.KEEP_RAW_PAYLOADS or args.keep_raw
+    enriched_data = data.main(data.HOURS if args.hours is None else args.hours)
+    if not enriched_data:
+        return
+    premises = models.parse_premises(enriched_data)
+    hub.process_premises_for_hubspot(premises)
+    prem.process_premises(premises)
+    if associations.SYNC_ASSOCIATIONS:
+        associations.sync_associations(premises)
+
+# Poll AEX continuously and push changes, keeping caches and connections warm
+def run_daemon(args):
+    import data
+    import daemon
+    daemon.run_daemon(interval=args.interval_minutes * 60, initial_hours=data.HOURS if args.hours is None else args.hours)
+
+# Receive AEX change notifications and push the affected premises
+def run_ingest(args):
+    import ingest
+    ingest.run_ingest(port=args.port, poll_hours=args.poll_hours or None, host=args.host or ingest.INGEST_HOST)
+
+# Re-drive failed HubSpot writes from the dead-letter store
+def run_replay(args):
+    import hub
+    import dead_letter
+
+    if args.list:
+        for entry in dead_letter.list_entries():
+            print(f"{entry['id']:>6}  {entry['object_type']:<12} {entry['operation']:<7} {entry['record_key']:<12} "
+                  f"attempts={entry['attempts']}  status={entry['status_code']}  {entry['last_attempt_at']}")
+        return
+
+    replayed, failing = dead_letter.replay(
+        hub.get_hubspot_headers(), batch_size=args.batch_size, max_attempts=args.max_attempts
+    )
+    print(f"Replayed {replayed} dead letters, {failing} still failing.")
+
+# Compare a full AEX snapshot with everything in HubSpot and apply only the differences
+def run_reconcile(args):
+    import hub
+    import reconcile
+
+    summary = reconcile.reconcile(
+        hub.load_enriched_data(args.snapshot), dry_run=args.dry_run, output_file=args.output, batch_size=args.batch_size
+    )
+    for object_type, counts in summary.items():
+        print(f"{object_type:<12} " + "  ".join(f"{name}={value}" for name, value in counts.items()))
+
+# Create the ticket, contact and premises associations HubSpot is missing for a snapshot
+def run_associate(args):
+    import hub
+    import associations
+
+    headers = hub.get_hubspot_headers()
+    associations.load_hubspot_ids(headers)
+    summary = associations.sync_associations(
+        hub.load_enriched_data(args.snapshot), headers, dry_run=args.dry_run, batch_size=args.batch_size
+    )
+    for pair, counts in summary.items():
+        print(f"{pair:<20} " + "  ".join(f"{name}={value}" for name, value in counts.items()))
+
+# Project the calls, outcomes and wall time of a sync without contacting any API
+def run_plan(args):
+    import logging
+    import data
+    import hub
+    import planner
+
+    # Per-record skip and warning logs would drown the report
+    logging.disable(logging.ERROR)
+    hours = data.HOURS if args.hours is None else args.hours
+    work_orders_total = args.work_orders_total
+    if work_orders_total is None and args.aex_total and data.ENRICHMENT_STRATEGY == 'bulk':
+        work_orders_total = planner.fetch_work_orders_total(hours)
+    if args.premises is not None or args.aex_total:
+        total = args.premises if args.premises is not None else planner.fetch_premises_total(hours)
+        plan = planner.plan_totals(total, args.services_per_premise, args.work_orders_per_service, args.premises_per_customer,
+                                   work_orders_total)
+    else:
+        plan = planner.plan_snapshot(hub.load_enriched_data(args.snapshot), warm_caches=args.warm_caches,
+                                     work_orders_total=work_orders_total)
+    for line in planner.format_plan(plan, args.concurrency or planner.CONCURRENCY):
+        print(line)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="premise-flow", description="Sync AEX premises to HubSpot.")
+    parser.add_argument("--trace-file", default=None, help="Append per-premise trace spans to this JSON-lines file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    fetch_parser = subparsers.add_parser("fetch", help="Fetch and enrich premises from AEX")
+    fetch_parser.add_argument("--hours", type=int, default=None, help="Look-back window (defaults to data.HOURS)")
+    fetch_parser.add_argument("--keep-raw", action="store_true", help="Keep full API responses in the snapshot")
+    fetch_parser.add_argument("--full", action="store_true",
+                              help="Fetch a full snapshot for reconcile: every work order status, over data.FULL_FETCH_HOURS unless --hours is given")
+    fetch_parser.set_defaults(func=run_fetch)
+
+    contacts_parser = subparsers.add_parser("push-contacts", help="Push contacts and tickets to HubSpot")
+    contacts_parser.add_argument("--snapshot", default="enriched_premises_data.json")
+    contacts_parser.set_defaults(func=run_push_contacts)
+
+    premises_parser = subparsers.add_parser("push-premises", help="Push premises objects to HubSpot")
+    premises_parser.add_argument("--snapshot", default="enriched_premises_data.json")
+    premises_parser.set_defaults(func=run_push_premises)
+
+    all_parser = subparsers.add_parser("run-all", help="Fetch, then push contacts, tickets and premises")
+    all_parser.add_argument("--hours", type=int, default=None, help="Look-back window (defaults to data.HOURS)")
+    all_parser.add_argument("--keep-raw", action="store_true", help="Keep full API responses in the snapshot")
+    all_parser.set_defaults(func=run_all)
+
+    daemon_parser = subparsers.add_parser("daemon", help="Poll AEX continuously and push changes to HubSpot")
+    daemon_parser.add_argument("--interval-minutes", type=float, default=15, help="Minutes between polls")
+    daemon_parser.add_argument("--hours", type=int, default=None, help="Look-back window for the first poll (defaults to data.HOURS)")
+    daemon_parser.set_defaults(func=run_daemon)
+
+    ingest_parser = subparsers.add_parser("ingest", help="Receive AEX change notifications and push affected premises")
+    ingest_parser.add_argument("--port", type=int, default=8085)
+    ingest_parser.add_argument("--host", default=None, help="Interface to listen on (default 127.0.0.1; others need INGEST_SECRET)")
+    ingest_parser.add_argument("--poll-hours", type=float, default=6, help="Hours between safety-net polls (0 disables)")
+    ingest_parser.set_defaults(func=run_ingest)
+
+    replay_parser = subparsers.add_parser("replay", help="Replay failed HubSpot writes from the dead-letter store")
+    replay_parser.add_argument("--list", action="store_true", help="List pending dead letters instead of replaying")
+    replay_parser.add_argument("--batch-size", type=int, default=100)
+    replay_parser.add_argument("--max-attempts", type=int, default=None, help="Skip entries that have failed this many times")
+    replay_parser.set_defaults(func=run_replay)
+
+    reconcile_parser = subparsers.add_parser("reconcile", help="Reconcile HubSpot against a full AEX snapshot")
+    reconcile_parser.add_argument("--snapshot", default="enriched_premises_data.json", help="Snapshot of all premises, from fetch --full")
+    reconcile_parser.add_argument("--dry-run", action="store_true", help="Only plan the corrections")
+    reconcile_parser.add_argument("--output", default=None, help="Write the planned corrections to this JSON-lines file")
+    reconcile_parser.add_argument("--batch-size", type=int, default=100)
+    reconcile_parser.set_defaults(func=run_reconcile)
+
+    associate_parser = subparsers.add_parser("associate", help="Create missing ticket, contact and premises associations")
+    associate_parser.add_argument("--snapshot", default="enriched_premises_data.json")
+    associate_parser.add_argument("--dry-run", action="store_true", help="Only count the missing associations")
+    associate_parser.add_argument("--batch-size", type=int, default=1000)
+    associate_parser.set_defaults(func=run_associate)
+
+    plan_parser = subparsers.add_parser("plan", help="Estimate the API calls and wall time of a sync, offline")
+    plan_parser.add_argument("--snapshot", default="enriched_premises_data.json", help="Enriched snapshot to plan for")
+    plan_parser.add_argument("--warm-caches", action="store_true", help="Assume locally known HubSpot IDs need no search, as in the daemon")
+    plan_parser.add_argument("--premises", type=int, default=None, help="Plan from a premises total instead of a snapshot")
+    plan_parser.add_argument("--aex-total", action="store_true", help="Read the premises total for --hours from AEX (one request)")
+    plan_parser.add_argument("--hours", type=float, default=None, help="Window for --aex-total (defaults to data.HOURS)")
+    plan_parser.add_argument("--work-orders-total", type=int, default=None,
+                             help="Work orders the /work-orders sweep reports for the window (read from AEX with --aex-total)")
+    plan_parser.add_argument("--services-per-premise", type=float, default=1.0)
+    plan_parser.add_argument("--work-orders-per-service", type=float, default=2.0)
+    plan_parser.add_argument("--premises-per-customer", type=float, default=1.0)
+    plan_parser.add_argument("--concurrency", type=int, default=None, help="Requests in flight at once (defaults to PLAN_CONCURRENCY)")
+    plan_parser.set_defaults(func=run_plan)
+
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.trace_file:
+        import tracing
+        tracing.configure(args.trace_file)
+    args.func(args)
+
+# Run the main function
+if __name__ == "__main__":
+    main()
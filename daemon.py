@@ -0,0 +1,79 @@
+import signal
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import data
+import hub
+import prem
+import models
+import associations
+
+# Long-running sync: polls AEX for premises updated since the previous poll and pushes
+# them to HubSpot, keeping connection pools, reference data and HubSpot ID caches warm
+# in memory between polls instead of rebuilding them on every cron run.
+
+# Seconds between polls
+POLL_INTERVAL_SECONDS = 15 * 60
+
+# Each window starts this far before the previous poll began, so records committed
+# while a poll was running are not missed
+POLL_OVERLAP_SECONDS = 5 * 60
+
+# Fetch, enrich and push one incremental window
+def sync_window(updated_after, sales_rep_data, ticket_types):
+    logging.info(f"Syncing premises updated after {updated_after}")
+    # A failed AEX call raises, so a window is never pushed (or skipped) with gaps
+    enriched_data = data.fetch_and_enrich(updated_after, require_complete=True)
+
+    if not enriched_data:
+        logging.info("No premises changed in this window.")
+        return 0
+
+    premises = models.parse_premises(enriched_data)
+    hub.process_premises_for_hubspot(premises, sales_rep_data, ticket_types)
+    prem.process_premises(premises)
+    if associations.SYNC_ASSOCIATIONS:
+        associations.sync_associations(premises)
+    logging.info(f"Synced {len(enriched_data)} premises.")
+    return len(enriched_data)
+
+# Sync one window and return where the next one starts. A window that failed (including
+# any failed AEX fetch) is kept, so the next poll retries it.
+def poll(updated_after, sales_rep_data, ticket_types):
+    poll_started = datetime.now()
+    try:
+        sync_window(updated_after, sales_rep_data, ticket_types)
+    except Exception as e:
+        logging.error(f"Sync failed, retrying the same window next poll: {e}")
+        return updated_after
+    return data.format_updated_after(poll_started - timedelta(seconds=POLL_OVERLAP_SECONDS))
+
+# Stop the loop on SIGINT/SIGTERM once the current window has finished
+def install_signal_handlers(stop_event):
+    def handle_signal(signum, frame):
+        logging.info(f"Received signal {signum}, shutting down after the current sync.")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+def run_daemon(interval=POLL_INTERVAL_SECONDS, initial_hours=data.HOURS, stop_event=None):
+    stop_event = stop_event or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        install_signal_handlers(stop_event)
+
+    # Reference data is loaded once and reused for every window
+    sales_rep_data = hub.load_sales_rep_data()
+    ticket_types = hub.load_ticket_types()
+
+    updated_after = data.get_updated_after(initial_hours)
+    while not stop_event.is_set():
+        updated_after = poll(updated_after, sales_rep_data, ticket_types)
+        stop_event.wait(interval)
+
+    logging.info("Daemon stopped.")
+
+# Run the main function
+if __name__ == "__main__":
+    run_daemon()
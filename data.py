@@ -1,58 +1,210 @@
 import os
 import requests
 import json
+import logging
 from datetime import datetime, timedelta
 
-# Base URL for API
-BASE_URL = "https://fno.national-us.aex.systems"
+import tracing
 
-# Fetch API_TOKEN from environment or .env file
-API_TOKEN = os.getenv('API_TOKEN')   # Fetching API token from environment variable
+# Base URL for API (overridable, e.g. to point at a local fake server)
+BASE_URL = os.getenv('AEX_BASE_URL', "https://fno.national-us.aex.systems")
 
-if not API_TOKEN:
-    raise Exception("API_TOKEN environment variable is not set")
+_headers = None
 
-HEADERS = {
-    "Authorization": f"Bearer {API_TOKEN}",
-    "Content-Type": "application/json"
-}
+# Shared session so connections to AEX are pooled and reused across calls
+session = requests.Session()
+tracing.instrument_session(session, "aex")
+
+# Build the request headers, fetching API_TOKEN from the environment on first use
+# so that importing this module for a helper does not require credentials
+def get_headers():
+    global _headers
+    if _headers is None:
+        api_token = os.getenv('API_TOKEN')   # Fetching API token from environment variable
+
+        if not api_token:
+            raise Exception("API_TOKEN environment variable is not set")
+
+        _headers = {
+            "Authorization": f"Bearer {api_token}",
+            "Content-Type": "application/json"
+        }
+    return _headers
 
 # Set the number of hours for 'updated_after'. If None, defaults to 24 hours.
 HOURS = 5
 
+# How work orders are attached to services during enrichment:
+#   "bulk"        - sweep /work-orders by 'updated_after' page by page and join them locally by service_id
+#   "per_service" - call /work-orders once per service with only the service filter, as before
+#                   the sweep existed; the fallback when the sweep fails, so it does not rely
+#                   on the sweep's query parameters (excluded statuses are dropped locally)
+ENRICHMENT_STRATEGY = os.getenv('ENRICHMENT_STRATEGY', 'bulk')
+
+# Page size requested from AEX list endpoints
+PAGE_SIZE = int(os.getenv('AEX_PAGE_SIZE', '100'))
+
+# Work order statuses hub.py never turns into tickets. The sweep asks AEX to leave them
+# out, and anything the API still returns is dropped before enrichment. Statuses without
+# a ticket pipeline stage are kept; hub.py logs and skips them at push time.
+EXCLUDED_WORK_ORDER_STATUSES = ["cancelled"]
+
+# Keep work orders of every status, excluded ones included (no status filter in the query
+# or locally). Full snapshots for reconcile are fetched this way, so tickets whose work
+# order was cancelled later are seen instead of looking like they were never synced.
+KEEP_ALL_WORK_ORDERS = os.getenv('KEEP_ALL_WORK_ORDERS', '') == '1'
+
+# Look-back window of a full fetch (about ten years)
+FULL_FETCH_HOURS = 87600
+
+# Query parameter names used to push filters down to the AEX API. These names are assumed,
+# not taken from AEX documentation. If AEX ignores them, results stay correct: the paging
+# loops follow the reported total, and excluded statuses are dropped again locally. Only
+# the page size and the amount downloaded differ.
+QUERY_PARAMS = {
+    "page_size": "per_page",
+    "exclude_statuses": "status_not",
+}
+
+# Keep the full API responses in the snapshot instead of only the projected fields below
+KEEP_RAW_PAYLOADS = os.getenv('KEEP_RAW_PAYLOADS', '') == '1'
+
+# Raised instead of leaving a gap when a fetch fails and the caller needs the complete
+# window (the daemon keeps the window and retries it on the next poll)
+class FetchError(Exception):
+    pass
+
+# With require_complete, a failed fetch (None) aborts the window
+def _check_fetched(value, require_complete, what):
+    if value is None and require_complete:
+        raise FetchError(f"Could not fetch {what}")
+    return value
+
+# Field paths hub.py and prem.py read from each response. Only these are kept in memory
+# and written to the snapshot; a path through a list applies to every element.
+PREMISE_FIELDS = [
+    "id", "customer_id", "street_number", "street_name", "city", "province", "postal_code",
+    "latitude", "longitude", "status", "updated_at",
+]
+SERVICE_DETAILS_FIELDS = [
+    "full_service.service.id", "full_service.service.premise_id", "full_service.service.status",
+    "full_service.service.updated_at", "full_service.isp_product.id", "full_service.isp_product.name",
+]
+WORK_ORDER_FIELDS = [
+    "id", "service_id", "type", "status", "description", "last_comment",
+    "created_at", "updated_at", "schedule_date", "completed_date",
+]
+CUSTOMER_DETAILS_FIELDS = ["id", "first_name", "last_name", "email", "mobile_number"]
+CUSTOMER_SERVICES_FIELDS = ["total", "items.id", "items.sales_channel_id"]
+
+# Turn a list of dotted field paths into a nested dict of the keys to keep
+def compile_fields(paths):
+    tree = {}
+    for path in paths:
+        node = tree
+        for part in path.split('.'):
+            node = node.setdefault(part, {})
+    return tree
+
+# Keep only the compiled fields of a response (everything below a path's last key is kept as is)
+def project(value, tree):
+    if not tree or value is None or KEEP_RAW_PAYLOADS:
+        return value
+    if isinstance(value, list):
+        return [project(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
+
+PREMISE_PROJECTION = compile_fields(PREMISE_FIELDS)
+PREMISES_PAGE_PROJECTION = compile_fields(["total"] + [f"items.{field}" for field in PREMISE_FIELDS])
+SERVICE_DETAILS_PROJECTION = compile_fields(SERVICE_DETAILS_FIELDS)
+WORK_ORDERS_PAGE_PROJECTION = compile_fields(["total"] + [f"items.{field}" for field in WORK_ORDER_FIELDS])
+CUSTOMER_DETAILS_PROJECTION = compile_fields(CUSTOMER_DETAILS_FIELDS)
+CUSTOMER_SERVICES_PROJECTION = compile_fields(CUSTOMER_SERVICES_FIELDS)
+
 # Function to get 'updated_after' date (24 hours prior or custom interval)
 def get_updated_after(hours=None):
     # If hours is None, default to 24 hours
     if hours is None:
         hours = 24
     pull_time = datetime.now() - timedelta(hours=hours)
-    formatted_time = pull_time.isoformat().replace('T', ' ').split('.')[0]
-    return formatted_time
+    return format_updated_after(pull_time)
+
+# Format a datetime the way the 'updated_after' filter expects it
+def format_updated_after(pull_time):
+    return pull_time.isoformat().replace('T', ' ').split('.')[0]
+
+# Build query parameters for an AEX list endpoint, pushing supported filters to the API
+def build_query_params(updated_after=None, page=None, exclude_statuses=None, **filters):
+    params = dict(filters)
+    if updated_after:
+        params["updated_after"] = updated_after
+    if page is not None:
+        params["page"] = page
+        params[QUERY_PARAMS["page_size"]] = PAGE_SIZE
+    if exclude_statuses:
+        params[QUERY_PARAMS["exclude_statuses"]] = ",".join(exclude_statuses)
+    return params
+
+# Drop work orders with an excluded status, for when the API did not apply the filter
+def filter_work_orders(work_orders):
+    if KEEP_ALL_WORK_ORDERS:
+        return list(work_orders)
+    kept = []
+    excluded = {status.lower() for status in EXCLUDED_WORK_ORDER_STATUSES}
+    for work_order in work_orders:
+        status = (work_order.get('status') or '').strip().lower()
+        if status in excluded:
+            logging.debug(f"Dropping work order {work_order.get('id')} with excluded status '{status}'")
+            continue
+        kept.append(work_order)
+    if len(kept) < len(work_orders):
+        print(f"Dropped {len(work_orders) - len(kept)} of {len(work_orders)} work orders with an excluded status")
+    return kept
 
 # Fetch premises with updated_after filter and handle pagination
+@tracing.traced("aex.fetch_premises", page="page")
 def fetch_premises(updated_after, page=1):
     url = f"{BASE_URL}/premises"
-    params = {
-        "updated_after": updated_after,
-        "page": page
-    }
+    params = build_query_params(updated_after=updated_after, page=page)
 
     try:
-        response = requests.get(url, headers=HEADERS, params=params)
+        response = session.get(url, headers=get_headers(), params=params)
         if response.status_code == 200:
-            return response.json()
+            return project(response.json(), PREMISES_PAGE_PROJECTION)
         else:
             raise Exception(f"Error fetching premises (page {page}): {response.status_code}")
     except Exception as e:
+        tracing.current_span().set_error(e)
+        print(f"An error occurred: {e}")
+        return None
+
+# Fetch a single premise by premise_id. The /premises/{id} endpoint is assumed, not taken
+# from AEX documentation. If AEX does not serve it, every event is logged as an error here
+# and its premise is only picked up by the ingest safety-net poll.
+@tracing.traced("aex.fetch_premise", premise_id="premise_id")
+def fetch_premise(premise_id):
+    url = f"{BASE_URL}/premises/{premise_id}"
+
+    try:
+        response = session.get(url, headers=get_headers())
+        if response.status_code == 200:
+            return project(response.json(), PREMISE_PROJECTION)
+        else:
+            raise Exception(f"Error fetching premise {premise_id}: {response.status_code}")
+    except Exception as e:
+        tracing.current_span().set_error(e)
         print(f"An error occurred: {e}")
         return None
 
 # Fetch services for each premise by premise_id and log response
+@tracing.traced("aex.fetch_services", premise_id="premise_id")
 def fetch_services(premise_id):
     url = f"{BASE_URL}/services?premise={premise_id}"  # Correctly passing the premise_id in the URL
 
     try:
-        response = requests.get(url, headers=HEADERS)
+        response = session.get(url, headers=get_headers())
         if response.status_code == 200:
             services_data = response.json()
             services = services_data.get('items', [])  # Extract the list of services from 'items'
@@ -61,67 +213,130 @@ def fetch_services(premise_id):
         else:
             raise Exception(f"Error fetching services for premise {premise_id}: {response.status_code}")
     except Exception as e:
+        tracing.current_span().set_error(e)
         print(f"An error occurred while fetching services: {e}")
         return None
 
 # Fetch full service details and work orders by service_id
+@tracing.traced("aex.fetch_service_details", service_id="service_id")
 def fetch_service_details(service_id):
     full_service_url = f"{BASE_URL}/services/{service_id}/full"
 
     try:
-        full_service_response = requests.get(full_service_url, headers=HEADERS)
+        full_service_response = session.get(full_service_url, headers=get_headers())
 
         if full_service_response.status_code == 200:
-            return full_service_response.json()
+            return project(full_service_response.json(), SERVICE_DETAILS_PROJECTION)
         else:
             raise Exception(f"Error fetching details for service {service_id}")
     except Exception as e:
+        tracing.current_span().set_error(e)
         print(f"An error occurred: {e}")
         return None
 
-# Fetch work orders by service_id
+# Fetch all work orders of a service. Only the service filter is sent, so this path does
+# not depend on the sweep's assumed query parameters.
+@tracing.traced("aex.fetch_work_orders", service_id="service_id")
 def fetch_work_orders(service_id):
     url = f"{BASE_URL}/work-orders"
     params = {"service": service_id}  # Correctly passing the service_id
 
     try:
-        response = requests.get(url, headers=HEADERS, params=params)
+        response = session.get(url, headers=get_headers(), params=params)
         if response.status_code == 200:
-            return response.json()
+            work_orders = project(response.json(), WORK_ORDERS_PAGE_PROJECTION)
+            items = filter_work_orders(work_orders.get('items', []))
+            return {**work_orders, "items": items, "total": len(items)}
         else:
             raise Exception(f"Error fetching work orders for service {service_id}: {response.status_code}")
     except Exception as e:
+        tracing.current_span().set_error(e)
+        print(f"An error occurred while fetching work orders: {e}")
+        return None
+
+# Fetch a page of work orders with updated_after filter
+@tracing.traced("aex.fetch_work_orders_page", page="page")
+def fetch_work_orders_page(updated_after, page=1):
+    url = f"{BASE_URL}/work-orders"
+    params = build_query_params(
+        updated_after=updated_after, page=page, exclude_statuses=None if KEEP_ALL_WORK_ORDERS else EXCLUDED_WORK_ORDER_STATUSES
+    )
+
+    try:
+        response = session.get(url, headers=get_headers(), params=params)
+        if response.status_code == 200:
+            return project(response.json(), WORK_ORDERS_PAGE_PROJECTION)
+        else:
+            raise Exception(f"Error fetching work orders (page {page}): {response.status_code}")
+    except Exception as e:
+        tracing.current_span().set_error(e)
         print(f"An error occurred while fetching work orders: {e}")
         return None
 
+# Loop through all pages of recently updated work orders and index them by service_id
+def fetch_all_work_orders(updated_after):
+    work_orders_by_service = {}
+    items_fetched = 0
+    current_page = 1
+
+    while True:
+        work_orders_data = fetch_work_orders_page(updated_after, page=current_page)
+
+        if work_orders_data is None:
+            # Without the full sweep we cannot tell "no work orders" from "not fetched"
+            print("Work order sweep failed, falling back to per-service fetches")
+            return None
+
+        items = work_orders_data.get('items', [])
+        for work_order in filter_work_orders(items):
+            work_orders_by_service.setdefault(work_order.get('service_id'), []).append(work_order)
+
+        items_fetched += len(items)
+        total_items = work_orders_data.get('total', 0)
+
+        print(f"Fetched {items_fetched} out of {total_items} total work orders")
+
+        # Stop fetching if we have retrieved all items (or the API returned an empty page)
+        if items_fetched >= total_items or not items:
+            break
+
+        current_page += 1
+
+    return work_orders_by_service
+
 # Fetch customer details by customer_id
+@tracing.traced("aex.fetch_customer_details", customer_id="customer_id")
 def fetch_customer_details(customer_id):
     customer_url = f"{BASE_URL}/customers/{customer_id}"
     customer_services_url = f"{BASE_URL}/customers/{customer_id}/services"
 
     try:
-        customer_response = requests.get(customer_url, headers=HEADERS)
-        customer_services_response = requests.get(customer_services_url, headers=HEADERS)
+        customer_response = session.get(customer_url, headers=get_headers())
+        customer_services_response = session.get(customer_services_url, headers=get_headers())
 
         if customer_response.status_code == 200 and customer_services_response.status_code == 200:
             return {
-                "customer_details": customer_response.json(),
-                "customer_services": customer_services_response.json()
+                "customer_details": project(customer_response.json(), CUSTOMER_DETAILS_PROJECTION),
+                "customer_services": project(customer_services_response.json(), CUSTOMER_SERVICES_PROJECTION)
             }
         else:
             raise Exception(f"Error fetching details for customer {customer_id}")
     except Exception as e:
+        tracing.current_span().set_error(e)
         print(f"An error occurred: {e}")
         return None
 
 # Function to loop through all pages and collect premises data
-def fetch_all_premises(hours=None):
-    updated_after_time = get_updated_after(hours)  # Fetch data updated within the specified number of hours
+def fetch_all_premises(hours=None, updated_after=None, require_complete=False):
+    # Fetch data updated within the specified number of hours, unless an explicit start is given
+    updated_after_time = updated_after or get_updated_after(hours)
     all_premises = []
     current_page = 1
 
     while True:
-        premises_data = fetch_premises(updated_after_time, page=current_page)
+        premises_data = _check_fetched(
+            fetch_premises(updated_after_time, page=current_page), require_complete, f"premises page {current_page}"
+        )
 
         if premises_data is None:
             print("No data found or an error occurred")
@@ -143,47 +358,72 @@ def fetch_all_premises(hours=None):
 
     return all_premises
 
-# Enrich each premise with its services, work orders, and customer details
-def enrich_premises_with_services_and_customers(premises_data):
+# Enrich one premise with its services, work orders, and customer details.
+# customers caches customer details by customer_id across premises; fetched_services
+# holds service details already fetched by the caller, keyed by str(service_id).
+def enrich_premise(premise, customers, work_orders_by_service=None, require_complete=False, fetched_services=None):
+    premise_id = premise['id']
+    customer_id = premise['customer_id']
+
+    # Fetch related services for this premise
+    services = _check_fetched(fetch_services(premise_id), require_complete, f"services for premise {premise_id}")
+
+    # For each service, fetch detailed service info and work orders
+    service_details = []
+    if services and isinstance(services, list):  # Ensure services is a valid list
+        for service in services:
+            if isinstance(service, dict) and 'id' in service:
+                service_id = service['id']
+                
+                # Fetch detailed service info, unless the caller already has it
+                details = (fetched_services or {}).get(str(service_id))
+                if details is None:
+                    details = _check_fetched(fetch_service_details(service_id), require_complete, f"service {service_id}")
+                
+                # Look up related work orders for the service
+                if work_orders_by_service is not None:
+                    items = work_orders_by_service.get(service_id, [])
+                    work_orders = {"items": items, "total": len(items)}
+                else:
+                    work_orders = _check_fetched(
+                        fetch_work_orders(service_id), require_complete, f"work orders for service {service_id}"
+                    )
+
+                # Attach work orders to the service details
+                service_info = {
+                    "service_details": details,
+                    "work_orders": work_orders
+                }
+                service_details.append(service_info)
+            else:
+                print(f"Invalid service data for premise {premise_id}: {service}")
+    else:
+        print(f"No valid services found for premise {premise_id}")
+
+    # Fetch customer details for this premise
+    tracing.current_span().set_attribute("customer_cached", customer_id in customers)
+    if customer_id not in customers:
+        customers[customer_id] = _check_fetched(
+            fetch_customer_details(customer_id), require_complete, f"customer {customer_id}"
+        )
+    customer = customers[customer_id]
+
+    # Attach services and customer info to the premise data
+    premise['services'] = service_details
+    premise['customer'] = customer
+    return premise
+
+# Enrich each premise with its services, work orders, and customer details.
+# When work_orders_by_service is given (from fetch_all_work_orders), work orders are
+# joined from that index instead of being fetched once per service.
+def enrich_premises_with_services_and_customers(premises_data, work_orders_by_service=None, require_complete=False,
+                                                fetched_services=None):
     enriched_data = []
+    customers = {}  # customer_id -> customer details, so shared customers are fetched once
     for premise in premises_data:
-        premise_id = premise['id']
-        customer_id = premise['customer_id']
-
-        # Fetch related services for this premise
-        services = fetch_services(premise_id)
-
-        # For each service, fetch detailed service info and work orders
-        service_details = []
-        if services and isinstance(services, list):  # Ensure services is a valid list
-            for service in services:
-                if isinstance(service, dict) and 'id' in service:
-                    service_id = service['id']
-                    
-                    # Fetch detailed service info
-                    details = fetch_service_details(service_id)
-                    
-                    # Fetch related work orders for the service
-                    work_orders = fetch_work_orders(service_id)
-
-                    # Attach work orders to the service details
-                    service_info = {
-                        "service_details": details,
-                        "work_orders": work_orders
-                    }
-                    service_details.append(service_info)
-                else:
-                    print(f"Invalid service data for premise {premise_id}: {service}")
-        else:
-            print(f"No valid services found for premise {premise_id}")
-
-        # Fetch customer details for this premise
-        customer = fetch_customer_details(customer_id)
-
-        # Attach services and customer info to the premise data
-        premise['services'] = service_details
-        premise['customer'] = customer
-        enriched_data.append(premise)
+        with tracing.premise_span("aex.enrich_premise", premise['id'], customer_id=premise['customer_id']) as span:
+            enriched_data.append(enrich_premise(premise, customers, work_orders_by_service, require_complete, fetched_services))
+            span.set_attribute("service_count", len(premise['services']))
 
     return enriched_data
 
@@ -193,16 +433,31 @@ def save_data_to_file(data, filename="enriched_premises_data.json"):
         json.dump(data, json_file, indent=4)
         print(f"Data saved to {filename}")
 
+# Fetch premises updated after the given time and enrich them with services, work orders and customers.
+# With require_complete, any failed AEX call raises FetchError instead of returning partial data.
+def fetch_and_enrich(updated_after, require_complete=False):
+    all_premises_data = fetch_all_premises(updated_after=updated_after, require_complete=require_complete)
+
+    if not all_premises_data:
+        return []
+
+    work_orders_by_service = None
+    if ENRICHMENT_STRATEGY == 'bulk':
+        work_orders_by_service = fetch_all_work_orders(updated_after)
+
+    return enrich_premises_with_services_and_customers(all_premises_data, work_orders_by_service, require_complete)
+
 # Main function to demonstrate the API call with pagination and save enriched data to file
-def main():
-    all_premises_data = fetch_all_premises(HOURS)
+def main(hours=HOURS):
+    enriched_data = fetch_and_enrich(get_updated_after(hours))
 
-    if all_premises_data:
-        enriched_data = enrich_premises_with_services_and_customers(all_premises_data)
+    if enriched_data:
         save_data_to_file(enriched_data)
         print(f"Fetched and enriched {len(enriched_data)} premises in total.")
+        return enriched_data
     else:
         print("No premises data available or an error occurred")
+        return []
 
 # Run the main function
 if __name__ == "__main__":
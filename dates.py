@@ -0,0 +1,68 @@
+import os
+import logging
+import functools
+from collections import namedtuple
+from datetime import datetime, timezone
+
+# Date normalization for AEX timestamps. Every date field is converted once, when the
+# enriched data is parsed into records (models.py), into both forms HubSpot is sent:
+# a YYYY-MM-DD day and epoch milliseconds. Conversions are memoized, since the same
+# timestamps recur across work orders and runs in a resident process.
+
+# Timezone AEX timestamps without an explicit offset are in, e.g. "UTC" or
+# "Africa/Johannesburg". Unset, they are read in the host's local time, as before dates
+# were normalized here. Timestamps that carry an offset (or "Z") keep it. Either way the
+# day is the calendar day written in the timestamp; only epoch_ms depends on the zone.
+AEX_TIMEZONE = os.getenv('AEX_TIMEZONE') or None
+
+# Numeric epochs above this are taken as milliseconds rather than seconds
+EPOCH_MILLISECONDS_THRESHOLD = 10 ** 11
+
+# Distinct date strings kept in the conversion cache
+DATE_CACHE_SIZE = 65536
+
+# A normalized date: day is "YYYY-MM-DD", epoch_ms is milliseconds since the Unix epoch.
+# Both are None for a missing or unparseable value.
+Date = namedtuple('Date', ['day', 'epoch_ms'])
+
+EMPTY_DATE = Date(None, None)
+
+_timezone = None
+
+# The configured AEX timezone, or None for the host's local time
+def get_timezone():
+    global _timezone
+    if _timezone is None and AEX_TIMEZONE:
+        if AEX_TIMEZONE.upper() == 'UTC':
+            _timezone = timezone.utc
+        else:
+            from zoneinfo import ZoneInfo  # Only needed for non-UTC timezones
+            _timezone = ZoneInfo(AEX_TIMEZONE)
+    return _timezone
+
+# Convert an AEX date (an ISO 8601 string, with or without time and offset, or a Unix
+# epoch in seconds or milliseconds) to a Date
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
+def normalize_date(value):
+    if not value or isinstance(value, bool):
+        return EMPTY_DATE
+
+    tz = get_timezone()
+    if isinstance(value, (int, float)):
+        epoch_ms = int(value if abs(value) >= EPOCH_MILLISECONDS_THRESHOLD else value * 1000)
+        # An epoch has no written day, so it is given in the AEX timezone
+        dt = datetime.fromtimestamp(epoch_ms / 1000, tz)
+        return Date(dt.date().isoformat(), epoch_ms)
+
+    if not isinstance(value, str):
+        return EMPTY_DATE
+    try:
+        dt = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        logging.error(f"Invalid date format: {value}")
+        return EMPTY_DATE
+
+    if dt.tzinfo is None and tz is not None:
+        dt = dt.replace(tzinfo=tz)
+    # A naive datetime's timestamp() reads it in the host's local time
+    return Date(dt.date().isoformat(), int(dt.timestamp() * 1000))
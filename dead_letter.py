@@ -0,0 +1,285 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import contextlib
+from datetime import datetime
+
+import requests
+
+import hubspot_api
+from hubspot_api import session
+from property_diff import record_pushed, save_pushed_properties
+
+# Durable store for HubSpot writes that failed, so they can be replayed on their own
+# instead of re-running a whole window. Entries are keyed by (object type, operation,
+# key): the object ID for updates, or the AEX ID the object is created from for creates.
+# A later successful write of the same record (or, for creates, finding the object in
+# HubSpot) removes its entry, so replay never pushes a stale payload over newer data.
+# Creates are searched for by AEX key before they are replayed, so a create that failed
+# on our side but went through in HubSpot is not made twice.
+
+# SQLite file holding the dead letters
+DEAD_LETTER_DB = os.getenv('DEAD_LETTER_DB', "dead_letter.db")
+
+# HubSpot accepts at most 100 inputs per batch create/update
+REPLAY_BATCH_SIZE = 100
+
+# HubSpot accepts at most 100 values in a search IN filter
+SEARCH_BATCH_SIZE = 100
+
+# Retries per batch on 429/5xx before giving up until the next replay
+REPLAY_RETRIES = 4
+
+# Properties that carry the AEX ID a created object is keyed by, in lookup order
+# (tickets carry premise_id too, so work_order_id1 must come first)
+CREATE_KEY_PROPERTIES = ("work_order_id1", "aex_id", "premise_id")
+
+_lock = threading.Lock()
+_pending_keys = None
+
+# Open the store (creating the table on first use); commits and closes on exit
+@contextlib.contextmanager
+def _connect(filename=None):
+    connection = sqlite3.connect(filename or DEAD_LETTER_DB)
+    try:
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS dead_letters (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                object_type TEXT NOT NULL,
+                operation TEXT NOT NULL,
+                record_key TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                error TEXT,
+                status_code INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 1,
+                created_at TEXT NOT NULL,
+                last_attempt_at TEXT NOT NULL,
+                UNIQUE (object_type, operation, record_key)
+            )
+        """)
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+# Keys with an entry in the store, loaded once so successful writes can skip the database
+def _load_pending_keys():
+    global _pending_keys
+    if _pending_keys is None:
+        with _connect() as connection:
+            rows = connection.execute("SELECT object_type, operation, record_key FROM dead_letters").fetchall()
+        _pending_keys = set(rows)
+    return _pending_keys
+
+# Persist a failed write (or bump the attempt count of an existing entry for the same record)
+def record_failure(object_type, operation, key, payload, error, status_code=None):
+    now = datetime.now().isoformat(timespec='seconds')
+    entry_key = (object_type, operation, str(key))
+    with _lock:
+        try:
+            with _connect() as connection:
+                connection.execute("""
+                    INSERT INTO dead_letters (object_type, operation, record_key, payload, error, status_code, created_at, last_attempt_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (object_type, operation, record_key) DO UPDATE SET
+                        payload = excluded.payload,
+                        error = excluded.error,
+                        status_code = excluded.status_code,
+                        attempts = attempts + 1,
+                        last_attempt_at = excluded.last_attempt_at
+                """, (*entry_key, json.dumps(payload), str(error)[:2000], status_code, now, now))
+            _load_pending_keys().add(entry_key)
+        except sqlite3.Error as e:
+            logging.error(f"Could not record dead letter for {object_type} {operation} {key}: {e}")
+
+# Drop the entry for a record that has since been written successfully
+def resolve(object_type, operation, key):
+    entry_key = (object_type, operation, str(key))
+    with _lock:
+        if entry_key not in _load_pending_keys():
+            return
+        with _connect() as connection:
+            connection.execute(
+                "DELETE FROM dead_letters WHERE object_type = ? AND operation = ? AND record_key = ?", entry_key
+            )
+        _pending_keys.discard(entry_key)
+
+def list_entries(max_attempts=None):
+    query = "SELECT id, object_type, operation, record_key, payload, error, status_code, attempts, last_attempt_at FROM dead_letters"
+    params = ()
+    if max_attempts is not None:
+        query += " WHERE attempts < ?"
+        params = (max_attempts,)
+    with _connect() as connection:
+        rows = connection.execute(query + " ORDER BY id", params).fetchall()
+    columns = ("id", "object_type", "operation", "record_key", "payload", "error", "status_code", "attempts", "last_attempt_at")
+    entries = [dict(zip(columns, row)) for row in rows]
+    for entry in entries:
+        entry['payload'] = json.loads(entry['payload'])
+    return entries
+
+def _delete_entries(entries):
+    with _lock:
+        with _connect() as connection:
+            connection.executemany("DELETE FROM dead_letters WHERE id = ?", [(entry['id'],) for entry in entries])
+        for entry in entries:
+            _load_pending_keys().discard((entry['object_type'], entry['operation'], entry['record_key']))
+
+def _mark_failed(entries, error, status_code=None):
+    now = datetime.now().isoformat(timespec='seconds')
+    with _lock:
+        with _connect() as connection:
+            connection.executemany(
+                "UPDATE dead_letters SET attempts = attempts + 1, error = ?, status_code = ?, last_attempt_at = ? WHERE id = ?",
+                [(str(error)[:2000], status_code, now, entry['id']) for entry in entries]
+            )
+
+# Send one request, backing off on 429 and 5xx responses
+def send_with_backoff(method, url, headers, payload, base_delay):
+    response = None
+    for attempt in range(REPLAY_RETRIES + 1):
+        try:
+            response = session.request(method, url, headers=headers, json=payload)
+        except requests.RequestException as e:
+            logging.error(f"Replay request to {url} failed: {e}")
+            response = None
+        if response is not None and response.status_code != 429 and response.status_code < 500:
+            return response
+        if attempt < REPLAY_RETRIES:
+            retry_after = response.headers.get('Retry-After') if response is not None else None
+            time.sleep(float(retry_after) if retry_after else base_delay * (2 ** attempt))
+    return response
+
+# The record key a batch result corresponds to: the object ID for updates, or the
+# AEX ID property the object was created from for creates
+def _result_key(operation, result):
+    if operation == 'update':
+        return str(result.get('id'))
+    properties = result.get('properties', {})
+    for name in CREATE_KEY_PROPERTIES:
+        if properties.get(name) not in (None, ''):
+            return str(properties[name])
+    return None
+
+def _batch_input(entry):
+    if entry['operation'] == 'update':
+        return {"id": entry['record_key'], **entry['payload']}
+    return entry['payload']
+
+def _single_request(entry):
+    if entry['operation'] == 'update':
+        return "PATCH", f"{hubspot_api.BASE_URL}/crm/v3/objects/{entry['object_type']}/{entry['record_key']}"
+    return "POST", f"{hubspot_api.BASE_URL}/crm/v3/objects/{entry['object_type']}"
+
+# Record a replayed write the way the regular push does: remember the pushed properties
+# and, for creates, the new object's HubSpot ID
+def _record_success(entry, object_id):
+    import reconcile
+    if not object_id:
+        return
+    properties = entry['payload'].get('properties', {})
+    record_pushed(entry['object_type'], object_id, properties)
+    if entry['operation'] == 'create':
+        reconcile.remember_id(entry['object_type'], entry['record_key'], str(object_id), properties)
+
+# Find objects that already exist for create entries (e.g. a create that timed out after
+# HubSpot made the object), by AEX key and, for contacts, by email. Returns {record key: object ID}.
+def _find_existing(object_type, entries, headers, base_delay):
+    import reconcile
+    lookups = [(reconcile.OBJECT_KEYS[object_type], {entry['record_key']: entry['record_key'] for entry in entries})]
+    if object_type == 'contacts':
+        emails = {}
+        for entry in entries:
+            email = entry['payload'].get('properties', {}).get('email')
+            if email:
+                emails[str(email).strip().lower()] = entry['record_key']
+        lookups.append(('email', emails))
+
+    url = f"{hubspot_api.BASE_URL}/crm/v3/objects/{object_type}/search"
+    found = {}
+    for property_name, keys_by_value in lookups:
+        values = [value for value, key in keys_by_value.items() if key not in found]
+        for start in range(0, len(values), SEARCH_BATCH_SIZE):
+            query = {
+                "filterGroups": [{"filters": [{"propertyName": property_name, "operator": "IN", "values": values[start:start + SEARCH_BATCH_SIZE]}]}],
+                "properties": [property_name],
+                "limit": SEARCH_BATCH_SIZE
+            }
+            response = send_with_backoff("POST", url, headers, query, base_delay)
+            if response is None or response.status_code != 200:
+                raise Exception(f"Error searching existing {object_type}: {response.text if response is not None else 'No response'}")
+            for result in response.json().get('results', []):
+                value = str(result.get('properties', {}).get(property_name) or '')
+                key = keys_by_value.get(value.strip().lower() if property_name == 'email' else value)
+                if key is not None:
+                    found.setdefault(key, str(result['id']))
+    return found
+
+# Re-drive entries one at a time so a single bad record cannot fail the rest of its batch
+def _replay_individually(entries, headers, base_delay):
+    replayed = 0
+    for entry in entries:
+        method, url = _single_request(entry)
+        response = send_with_backoff(method, url, headers, entry['payload'], base_delay)
+        if response is not None and response.status_code in (200, 201):
+            _record_success(entry, entry['record_key'] if entry['operation'] == 'update' else response.json().get('id'))
+            _delete_entries([entry])
+            replayed += 1
+        else:
+            _mark_failed([entry], response.text if response is not None else "No response", getattr(response, 'status_code', None))
+    return replayed
+
+# Replay dead letters through HubSpot's batch create/update endpoints.
+# Returns (replayed, still failing).
+def replay(headers, batch_size=REPLAY_BATCH_SIZE, max_attempts=None, base_delay=1.0):
+    import reconcile
+    entries = list_entries(max_attempts)
+    groups = {}
+    for entry in entries:
+        groups.setdefault((entry['object_type'], entry['operation']), []).append(entry)
+
+    replayed = 0
+    for (object_type, operation), group in groups.items():
+        if operation == 'create':
+            # Never create an object twice: entries whose object exists by now are resolved instead
+            try:
+                existing = _find_existing(object_type, group, headers, base_delay)
+            except Exception as e:
+                logging.error(f"Skipping {object_type} create replay: {e}")
+                _mark_failed(group, e)
+                continue
+            found = [entry for entry in group if entry['record_key'] in existing]
+            for entry in found:
+                reconcile.remember_id(object_type, entry['record_key'], existing[entry['record_key']], entry['payload'].get('properties', {}))
+            _delete_entries(found)
+            replayed += len(found)
+            group = [entry for entry in group if entry['record_key'] not in existing]
+
+        url = f"{hubspot_api.BASE_URL}/crm/v3/objects/{object_type}/batch/{operation}"
+        for start in range(0, len(group), batch_size):
+            batch = group[start:start + batch_size]
+            response = send_with_backoff("POST", url, headers, {"inputs": [_batch_input(entry) for entry in batch]}, base_delay)
+
+            if response is not None and response.status_code in (200, 201, 207):
+                # Match results back to entries; on a partial success (207) keep only the failures
+                object_ids = {_result_key(operation, result): str(result.get('id')) for result in response.json().get('results', [])}
+                succeeded = [entry for entry in batch if entry['record_key'] in object_ids]
+                for entry in succeeded:
+                    _record_success(entry, object_ids[entry['record_key']])
+                _delete_entries(succeeded)
+                replayed += len(succeeded)
+                failed = [entry for entry in batch if entry['record_key'] not in object_ids]
+                if failed:
+                    _mark_failed(failed, response.text, response.status_code)
+            elif response is not None and response.status_code < 500 and response.status_code != 429:
+                # The whole batch was rejected; isolate the failing records
+                replayed += _replay_individually(batch, headers, base_delay)
+            else:
+                _mark_failed(batch, response.text if response is not None else "No response", getattr(response, 'status_code', None))
+            logging.info(f"Replayed {object_type} {operation} batch of {len(batch)}.")
+
+    save_pushed_properties()
+    return replayed, len(entries) - replayed
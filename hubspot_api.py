@@ -0,0 +1,17 @@
+import os
+
+import requests
+
+import tracing
+
+# Connection settings shared by every module that calls HubSpot (hub.py, prem.py,
+# property_diff.py, dead_letter.py, reconcile.py, associations.py), so all their calls
+# go through one connection pool and can be pointed elsewhere in one place.
+
+# Base URL for the HubSpot API (overridable, e.g. to point at a local fake server).
+# Read as hubspot_api.BASE_URL at call time, so changing it here redirects every caller.
+BASE_URL = os.getenv('HUBSPOT_BASE_URL', "https://api.hubapi.com")
+
+# One session for all HubSpot calls, so connections are pooled and reused across modules
+session = requests.Session()
+tracing.instrument_session(session, "hubspot")
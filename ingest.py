@@ -0,0 +1,213 @@
+import os
+import hmac
+import json
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import data
+import hub
+import prem
+import daemon
+import models
+import associations
+
+# Receiver for AEX change notifications. Each notification names a premise, service or
+# work order; the affected premises are re-enriched and pushed to HubSpot without
+# waiting for the next poll. Polling keeps running at a low frequency as a safety net.
+#
+# POST /events with one event or a list of events:
+#   {"type": "premise", "id": 123}
+#   {"type": "service", "id": 456, "premise_id": 123}      (premise_id optional)
+#   {"type": "work_order", "id": 789, "service_id": 456}   (premise_id or service_id required)
+
+EVENT_TYPES = ("premise", "service", "work_order")
+
+# Port the receiver listens on
+INGEST_PORT = 8085
+
+# Interface the receiver binds to. Only local callers can reach the default; listening on
+# any other interface requires INGEST_SECRET.
+INGEST_HOST = os.getenv('INGEST_HOST', '127.0.0.1')
+
+# Shared secret callers must send in the X-Ingest-Secret header (None accepts any local caller)
+INGEST_SECRET = os.getenv('INGEST_SECRET') or None
+SECRET_HEADER = "X-Ingest-Secret"
+
+LOOPBACK_HOSTS = ("127.0.0.1", "::1", "localhost")
+
+# Events arriving within this many seconds of each other are handled as one batch,
+# so a burst of changes to the same premise is only enriched once
+BATCH_WINDOW_SECONDS = 2
+
+# Hours between safety-net polls of /premises (None disables polling)
+SAFETY_NET_POLL_HOURS = 6
+
+# Check an event has what is needed to find its premise; returns an error message or None
+def validate_event(event):
+    if not isinstance(event, dict):
+        return "Event must be an object"
+    if event.get('type') not in EVENT_TYPES:
+        return f"Event type must be one of {', '.join(EVENT_TYPES)}"
+    if event.get('id') in (None, ''):
+        return "Event id is required"
+    if event['type'] == 'work_order' and not (event.get('premise_id') or event.get('service_id')):
+        return "Work order events need a premise_id or service_id"
+    return None
+
+# Work out which premise an event affects. Service details fetched on the way are kept
+# in fetched_services (by str(service_id)) so enrichment does not fetch them again.
+def resolve_premise_id(event, fetched_services=None):
+    if event['type'] == 'premise':
+        return event['id']
+    if event.get('premise_id'):
+        return event['premise_id']
+
+    service_id = event['id'] if event['type'] == 'service' else event['service_id']
+    details = data.fetch_service_details(service_id)
+    if details is not None and fetched_services is not None:
+        fetched_services[str(service_id)] = details
+    details = details or {}
+    premise_id = details.get('full_service', {}).get('service', {}).get('premise_id')
+    if premise_id is None:
+        logging.error(f"Could not resolve the premise for {event['type']} {event['id']}, dropping event.")
+    return premise_id
+
+# The premises a batch of events affects, each once. IDs arrive as numbers or strings,
+# so they are normalized to str before deduplicating.
+def resolve_premise_ids(events, fetched_services=None):
+    premise_ids = []
+    for event in events:
+        premise_id = resolve_premise_id(event, fetched_services)
+        if premise_id is not None and str(premise_id) not in premise_ids:
+            premise_ids.append(str(premise_id))
+    return premise_ids
+
+# Re-enrich the affected premises and push them to HubSpot
+def sync_premises(premise_ids, sales_rep_data, ticket_types, fetched_services=None):
+    premises = []
+    for premise_id in premise_ids:
+        premise = data.fetch_premise(premise_id)
+        if premise:
+            premises.append(premise)
+
+    if not premises:
+        return 0
+
+    enriched_data = models.parse_premises(
+        data.enrich_premises_with_services_and_customers(premises, fetched_services=fetched_services)
+    )
+    hub.process_premises_for_hubspot(enriched_data, sales_rep_data, ticket_types)
+    prem.process_premises(enriched_data)
+    if associations.SYNC_ASSOCIATIONS:
+        associations.sync_associations(enriched_data)
+    logging.info(f"Synced {len(enriched_data)} premises from change notifications.")
+    return len(enriched_data)
+
+# Drain the event queue in batches, running the safety-net poll whenever it is due
+def run_worker(events, stop_event, poll_hours=SAFETY_NET_POLL_HOURS):
+    sales_rep_data = hub.load_sales_rep_data()
+    ticket_types = hub.load_ticket_types()
+
+    next_poll = datetime.now() + timedelta(hours=poll_hours) if poll_hours else None
+    updated_after = data.get_updated_after(poll_hours) if poll_hours else None
+
+    while not stop_event.is_set():
+        # Checked on every pass, so a steady stream of events cannot hold the poll off.
+        # A failed poll keeps its window, like the daemon.
+        if next_poll and datetime.now() >= next_poll:
+            updated_after = daemon.poll(updated_after, sales_rep_data, ticket_types)
+            next_poll = datetime.now() + timedelta(hours=poll_hours)
+
+        try:
+            batch = [events.get(timeout=1)]
+        except queue.Empty:
+            continue
+
+        # Collect whatever else arrives within the batch window
+        deadline = datetime.now() + timedelta(seconds=BATCH_WINDOW_SECONDS)
+        while datetime.now() < deadline:
+            try:
+                batch.append(events.get(timeout=max(0, (deadline - datetime.now()).total_seconds())))
+            except queue.Empty:
+                break
+
+        fetched_services = {}
+        premise_ids = resolve_premise_ids(batch, fetched_services)
+        try:
+            sync_premises(premise_ids, sales_rep_data, ticket_types, fetched_services)
+        except Exception as e:
+            logging.error(f"Error syncing premises {premise_ids}: {e}")
+
+
+class IngestHandler(BaseHTTPRequestHandler):
+    def _respond(self, status, payload):
+        encoded = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Ingest request: {format % args}")
+
+    def do_POST(self):
+        secret = self.server.secret
+        if secret and not hmac.compare_digest(self.headers.get(SECRET_HEADER, '').encode(), secret.encode()):
+            self._respond(401, {"error": "Unauthorized"})
+            return
+
+        if self.path.rstrip('/') != '/events':
+            self._respond(404, {"error": "Not found"})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'null')
+        except ValueError:
+            self._respond(400, {"error": "Body must be JSON"})
+            return
+
+        events = body if isinstance(body, list) else [body]
+        errors = [error for error in (validate_event(event) for event in events) if error]
+        if errors:
+            self._respond(422, {"errors": errors})
+            return
+
+        for event in events:
+            self.server.events.put(event)
+        self._respond(202, {"accepted": len(events)})
+
+# Start the receiver on a background thread and return the server
+def start_receiver(events, port=INGEST_PORT, host=INGEST_HOST, secret=INGEST_SECRET):
+    if host not in LOOPBACK_HOSTS and not secret:
+        raise Exception(f"Set INGEST_SECRET before listening on {host}; the receiver would accept events from anyone")
+
+    server = ThreadingHTTPServer((host, port), IngestHandler)
+    server.daemon_threads = True
+    server.events = events
+    server.secret = secret
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Listening for change notifications on {host}:{server.server_address[1]}")
+    return server
+
+def run_ingest(port=INGEST_PORT, poll_hours=SAFETY_NET_POLL_HOURS, stop_event=None, host=INGEST_HOST):
+    stop_event = stop_event or threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        daemon.install_signal_handlers(stop_event)
+
+    events = queue.Queue()
+    server = start_receiver(events, port, host)
+    try:
+        run_worker(events, stop_event, poll_hours)
+    finally:
+        server.shutdown()
+        server.server_close()
+    logging.info("Ingest receiver stopped.")
+
+# Run the main function
+if __name__ == "__main__":
+    run_ingest()
@@ -0,0 +1,219 @@
+import logging
+
+from dates import EMPTY_DATE, normalize_date
+
+# Compact in-memory records for the enriched premises data. data.py still produces (and
+# saves) nested dicts; parse_premises turns them into these records once, validating
+# the structure on the way, so hub.py and prem.py read plain attributes instead of
+# walking chains of .get(..., {}). Each record uses __slots__, so it carries no
+# per-instance dict and holds only the fields the push stages use. Date fields hold
+# dates.Date values (day and epoch milliseconds), converted once while parsing.
+
+
+class WorkOrder:
+    __slots__ = ("id", "service_id", "type", "status", "description", "last_comment",
+                 "created_at", "updated_at", "schedule_date", "completed_date")
+
+    def __init__(self, id, service_id='', type=None, status='', description='', last_comment=None,
+                 created_at=EMPTY_DATE, updated_at=EMPTY_DATE, schedule_date=EMPTY_DATE, completed_date=EMPTY_DATE):
+        self.id = id
+        self.service_id = service_id
+        self.type = type
+        self.status = status  # Stripped and lower-cased
+        self.description = description
+        self.last_comment = last_comment
+        self.created_at = created_at
+        self.updated_at = updated_at
+        self.schedule_date = schedule_date
+        self.completed_date = completed_date
+
+    @classmethod
+    def from_dict(cls, work_order):
+        return cls(
+            id=work_order.get('id', ''),
+            service_id=work_order.get('service_id', ''),
+            type=work_order.get('type'),
+            status=(work_order.get('status') or '').strip().lower(),
+            description=work_order.get('description', ''),
+            last_comment=work_order.get('last_comment'),
+            created_at=normalize_date(work_order.get('created_at')),
+            updated_at=normalize_date(work_order.get('updated_at')),
+            schedule_date=normalize_date(work_order.get('schedule_date')),
+            completed_date=normalize_date(work_order.get('completed_date')),
+        )
+
+
+class Service:
+    __slots__ = ("id", "premise_id", "status", "updated_at", "product_id", "product_name", "work_orders")
+
+    def __init__(self, id, premise_id=None, status=None, updated_at=EMPTY_DATE, product_id=None, product_name='', work_orders=()):
+        self.id = id
+        self.premise_id = premise_id
+        self.status = status
+        self.updated_at = updated_at
+        self.product_id = product_id
+        self.product_name = product_name
+        self.work_orders = work_orders
+
+    # Parse one enriched service ({"service_details", "work_orders"}); returns None if it is unusable
+    @classmethod
+    def from_dict(cls, service, premise_id=None):
+        if not isinstance(service, dict):
+            logging.warning(f"Invalid service object: {service}. Skipping.")
+            return None
+
+        service_details = service.get('service_details')
+        if not service_details or not isinstance(service_details, dict):
+            logging.warning("Service details are missing or invalid, skipping service.")
+            return None
+
+        full_service = service_details.get('full_service', {})
+        if not isinstance(full_service, dict):
+            logging.warning("Full service details are missing or invalid, skipping service.")
+            return None
+
+        work_orders_data = service.get('work_orders')
+        if not work_orders_data or not isinstance(work_orders_data, dict):
+            logging.warning("Work orders data is missing or invalid, skipping service.")
+            return None
+
+        items = work_orders_data.get('items', [])
+        if not isinstance(items, list):
+            logging.warning(f"Expected 'work_orders' to be a list, but got {type(items)}. Skipping service.")
+            return None
+
+        work_orders = []
+        for work_order in items:
+            if not isinstance(work_order, dict):
+                logging.warning(f"Invalid work order object: {work_order}. Skipping.")
+                continue
+            work_orders.append(WorkOrder.from_dict(work_order))
+
+        service_metadata = full_service.get('service', {})
+        product = full_service.get('isp_product', {})
+        return cls(
+            id=service_metadata.get('id'),
+            premise_id=service_metadata.get('premise_id', premise_id),
+            status=service_metadata.get('status'),
+            updated_at=normalize_date(service_metadata.get('updated_at')),
+            product_id=product.get('id'),
+            product_name=product.get('name', ''),
+            work_orders=tuple(work_orders),
+        )
+
+
+class Customer:
+    __slots__ = ("id", "first_name", "last_name", "email", "mobile_number", "service_id", "sales_channel_id")
+
+    def __init__(self, id, first_name='', last_name='', email='', mobile_number='', service_id=None, sales_channel_id=None):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.email = email
+        self.mobile_number = mobile_number
+        self.service_id = service_id  # ID of the customer's first service
+        self.sales_channel_id = sales_channel_id  # Sales channel of the customer's first service
+
+    # Parse an enriched customer ({"customer_details", "customer_services"}); returns None
+    # if the customer or its details are missing
+    @classmethod
+    def from_dict(cls, customer):
+        if not isinstance(customer, dict):
+            return None
+        details = customer.get('customer_details') or {}
+        if not details:
+            return None
+
+        customer_services_items = (customer.get('customer_services') or {}).get('items', [])
+        first_service = customer_services_items[0] if customer_services_items else {}
+        return cls(
+            id=details.get('id', ''),
+            first_name=details.get('first_name', ''),
+            last_name=details.get('last_name', ''),
+            email=details.get('email', ''),
+            mobile_number=details.get('mobile_number', ''),
+            service_id=first_service.get('id'),
+            sales_channel_id=first_service.get('sales_channel_id'),
+        )
+
+
+class Premise:
+    __slots__ = ("id", "customer_id", "street_number", "street_name", "city", "province", "postal_code",
+                 "latitude", "longitude", "status", "updated_at", "product", "service_updated_at",
+                 "services", "customer")
+
+    def __init__(self, id, customer_id=None, street_number='', street_name='', city='', province='', postal_code='',
+                 latitude='', longitude='', status='', updated_at=EMPTY_DATE, product='', service_updated_at=EMPTY_DATE,
+                 services=(), customer=None):
+        self.id = id
+        self.customer_id = customer_id
+        self.street_number = street_number
+        self.street_name = street_name
+        self.city = city
+        self.province = province
+        self.postal_code = postal_code
+        self.latitude = latitude
+        self.longitude = longitude
+        self.status = status
+        self.updated_at = updated_at
+        self.product = product  # ISP product name of the premise's first valid service
+        self.service_updated_at = service_updated_at  # First updated_at found across its valid services
+        self.services = services  # Valid services only; None if 'services' was not a list
+        self.customer = customer  # None if the customer or its details are missing
+
+    @property
+    def address(self):
+        return f"{self.street_number} {self.street_name}"
+
+    @classmethod
+    def from_dict(cls, premise):
+        raw_services = premise.get('services', [])
+        services = None
+        product = ''
+        service_updated_at = EMPTY_DATE
+
+        if isinstance(raw_services, list):
+            services = []
+            for service in raw_services:
+                record = Service.from_dict(service, premise.get('id'))
+                if record is not None:
+                    services.append(record)
+                    if service_updated_at is EMPTY_DATE:
+                        service_updated_at = record.updated_at
+            if services:
+                product = services[0].product_name
+            services = tuple(services)
+        else:
+            logging.error(f"Expected 'services' to be a list, but got {type(raw_services)}.")
+
+        return cls(
+            id=premise.get('id', ''),
+            customer_id=premise.get('customer_id'),
+            street_number=premise.get('street_number', ''),
+            street_name=premise.get('street_name', ''),
+            city=premise.get('city', ''),
+            province=premise.get('province', ''),
+            postal_code=premise.get('postal_code', ''),
+            latitude=premise.get('latitude', ''),
+            longitude=premise.get('longitude', ''),
+            status=premise.get('status', ''),
+            updated_at=normalize_date(premise.get('updated_at')),
+            product=product,
+            service_updated_at=service_updated_at,
+            services=services,
+            customer=Customer.from_dict(premise.get('customer')),
+        )
+
+
+# Parse enriched premises into records, skipping empty entries. Records that were
+# already parsed are passed through, so callers can parse once and share the result.
+def parse_premises(premises_data):
+    premises = []
+    for premise in premises_data or []:
+        if isinstance(premise, Premise):
+            premises.append(premise)
+        elif not premise:
+            logging.warning("Premise data is None, skipping this premise.")
+        else:
+            premises.append(Premise.from_dict(premise))
+    return premises
@@ -0,0 +1,68 @@
+# HubSpot ticket pipelines and the stage each AEX work order status maps to
+
+installation_pipeline_stages = {
+    "Rejection": 2,
+    "closed - rejection - duplication": 2,
+    "Closed - rejection - duplication": 2,
+    "closed - rejected": 2,
+    "Fiber Ready": 3,
+    "Active Refusal": 4,
+    "Passive Refusal": 258799956,
+    "Pre Order": 258799957,
+    "New Order": 258799958,
+    "NID Relocate": 258799960,
+    "Civil Drop": 258799961,
+    "civil drop": 258799961,
+    "Optical Drop": 258799962,
+    "Soft Blockage": 258799963,
+    "Hard Blockage": 258799964,
+    "NCCH": 258799965,
+    "Full Handover": 258799966,
+    "NID Installation Complete": 258799967,
+    "ISP Scheduled": 258799968,
+    "ISP Complete": 258799969,
+    "Pending Auto Configuration": 258799970,
+    "pending configuration": 258799970,
+    "Auto Configuration Failed": 258799971,
+    "Activation Complete": 258799972,
+    "activation complete": 258799972,
+    "Not Actionable": 258799973,
+    "Installation": 258799974,
+    "Provisioning": 267644843,
+    "provisioning failed": 267644843,
+    "Provisioned": 267644843,
+    "Other": 267644850,
+    "NID Installation": 267644851,
+    "closed - nid - installation complete": 267644851,
+    "Service Activation (without installation)": 267644856,
+    "L3 Configuration": 267644930,
+    "configured": 267644930,
+    "Relocation": 267644931,
+    "Abandoned": 954945896
+}
+
+# Installation stages keyed by lower-cased status, as work order statuses are matched case-insensitively
+lower_case_pipeline_stages = {k.lower(): v for k, v in installation_pipeline_stages.items()}
+
+service_pipeline_stages = {
+    "Cancellation": 267644932,
+    "cancelled": 267644932,
+    "Cancelled": 267644932,
+    "Change Service": 267644933,
+    "Service change": 267644933,
+    "Change Service": 267644933,
+    "Fiber Break": 267644934,
+    "Service Down": 267644935,
+    "Light Levels": 267647763,
+    "Power Down": 267647764,
+    "Maintenance": 267647765,
+    "Swapout Device": 267647766,
+    "Recover Device": 267647767,
+    "Deprovisioning": 267647768,
+    "Speed Test": 267647769,
+    "Change Service Provider": 267647770,
+    "Fault": 267647771,
+    "service change approved": 954945906,
+    "rejected": 955026021,
+    "deprovisioned": 954733986
+}
@@ -0,0 +1,317 @@
+import os
+import math
+from collections import Counter, defaultdict
+
+import data
+import hub
+import prem
+import associations
+import property_diff
+from models import parse_premises
+from property_diff import diff_properties, load_pushed_properties
+from reconcile import OBJECT_KEYS
+
+# Offline sync planner. Walks the same control flow as data.py (fetch and enrich),
+# hub.py (contacts and tickets), prem.py (premises objects) and the association sync
+# for an enriched snapshot, without making any request, and projects the calls each
+# endpoint would receive. HubSpot IDs are looked up in the local last-pushed properties
+# cache (which keeps the AEX key of every object this sync created or reconciled), so
+# each object is predicted as a create, an update, or an unchanged skip. The call counts
+# are turned into a wall time estimate from per-call latency, concurrency and the API
+# rate limits, and compared with the HubSpot daily budget.
+#
+# Without a snapshot, a plan can be made from a premises total alone (e.g. the /premises
+# page total for a window) and average fan-outs. Nothing is known about those objects,
+# so every one is counted as a search plus a write: an upper bound.
+
+# Typical round trip per call, used for the latency-bound part of the wall time
+AEX_LATENCY_MS = float(os.getenv('PLAN_AEX_LATENCY_MS', '150'))
+HUBSPOT_LATENCY_MS = float(os.getenv('PLAN_HUBSPOT_LATENCY_MS', '150'))
+
+# Requests in flight at once. The pipeline makes its calls one at a time.
+CONCURRENCY = int(os.getenv('PLAN_CONCURRENCY', '1'))
+
+# Calls per second each API allows (0 for no limit). HubSpot private apps get 100 calls
+# per 10 seconds, and the CRM search endpoints are limited to 5 per second on their own.
+AEX_RATE_LIMIT = float(os.getenv('AEX_RATE_LIMIT', '0'))
+HUBSPOT_RATE_LIMIT = float(os.getenv('HUBSPOT_RATE_LIMIT', '10'))
+HUBSPOT_SEARCH_RATE_LIMIT = float(os.getenv('HUBSPOT_SEARCH_RATE_LIMIT', '5'))
+
+# HubSpot calls allowed per day for the account
+HUBSPOT_DAILY_LIMIT = int(os.getenv('HUBSPOT_DAILY_LIMIT', '250000'))
+
+# Average fan-outs assumed when planning from a premises total alone
+SERVICES_PER_PREMISE = 1.0
+WORK_ORDERS_PER_SERVICE = 2.0
+PREMISES_PER_CUSTOMER = 1.0
+
+
+# Projected calls per endpoint and the predicted outcome per object
+class SyncPlan:
+    def __init__(self, premises=0):
+        self.premises = premises
+        self.calls = Counter()               # (api, "METHOD /path") -> calls
+        self.outcomes = defaultdict(Counter)  # object type -> outcome -> objects
+
+    def call(self, api, endpoint, count=1):
+        if count:
+            self.calls[(api, endpoint)] += count
+
+    def total_calls(self, api):
+        return sum(count for (call_api, _), count in self.calls.items() if call_api == api)
+
+    def search_calls(self):
+        return sum(count for (api, endpoint), count in self.calls.items() if api == "hubspot" and endpoint.endswith("/search"))
+
+
+# HubSpot IDs known locally for each object type, read from the last-pushed properties
+# cache. Returns {object type: {AEX key: object ID}} (contacts also under "email:<email>").
+def load_known_ids():
+    known = {object_type: {} for object_type in OBJECT_KEYS}
+    for cache_key, properties in load_pushed_properties().items():
+        object_type, _, object_id = cache_key.rpartition(':')
+        if object_type not in known:
+            continue
+        key = properties.get(OBJECT_KEYS[object_type])
+        if key:
+            known[object_type][key] = object_id
+        if object_type == 'contacts' and properties.get('email'):
+            known[object_type][hub.email_key(properties['email'])] = object_id
+    return known
+
+def _batches(count, batch_size):
+    return math.ceil(count / batch_size) if count else 0
+
+# Page requests the data.py paging loops make for a list whose response reports total:
+# they stop once the items fetched reach the total, or on an empty page
+def _page_requests(total, page_size):
+    requests_made = 0
+    items_fetched = 0
+    while True:
+        requests_made += 1
+        items = min(page_size, max(0, total - items_fetched))
+        items_fetched += items
+        if items_fetched >= total or not items:
+            return requests_made
+
+# AEX calls made by data.fetch_and_enrich for a window of this shape. The work order
+# sweep pages through every work order updated in the window, which includes ones on
+# premises outside it and ones dropped client-side, so the snapshot's count is only a
+# lower bound; pass the /work-orders total for the window as work_orders_total when known.
+def plan_fetch(plan, premises, services, work_orders, customers, work_orders_total=None):
+    plan.call("aex", "GET /premises", _page_requests(premises, data.PAGE_SIZE))
+    if not premises:
+        return
+    if data.ENRICHMENT_STRATEGY == 'bulk':
+        sweep_total = work_orders if work_orders_total is None else work_orders_total
+        plan.call("aex", "GET /work-orders", _page_requests(sweep_total, data.PAGE_SIZE))
+    else:
+        plan.call("aex", "GET /work-orders", services)
+    plan.call("aex", "GET /services", premises)
+    plan.call("aex", "GET /services/{id}/full", services)
+    plan.call("aex", "GET /customers/{id}", customers)
+    plan.call("aex", "GET /customers/{id}/services", customers)
+
+# Calls and outcome of updating an existing object, following property_diff.changed_properties
+def _plan_update(plan, object_type, object_id, properties, fingerprints):
+    current = fingerprints.get(f"{object_type}:{object_id}")
+    changes = properties
+    if property_diff.PATCH_MODE != 'full' and current is not None:
+        # HubSpot's values are only known through the local copy of what was last pushed
+        changes = diff_properties(properties, current)
+    if changes:
+        plan.call("hubspot", f"PATCH /crm/v3/objects/{object_type}/{{id}}")
+        plan.outcomes[object_type]["update"] += 1
+    else:
+        plan.outcomes[object_type]["unchanged"] += 1
+
+# Look up an object the way the push does: an ID resolved earlier in the run is a cache
+# hit, anything else costs a search. With warm_caches, locally known IDs are cache hits
+# too, as in a resident daemon. Returns the object ID, or None if it would be created.
+def _plan_lookup(plan, object_type, keys, known, resolved, warm_caches):
+    for key in keys:
+        if key in resolved:
+            return resolved[key]
+    if not (warm_caches and any(key in known for key in keys)):
+        plan.call("hubspot", f"POST /crm/v3/objects/{object_type}/search")
+    for key in keys:
+        if key in known:
+            return known[key]
+    return None
+
+# Simulate hub.process_premises_for_hubspot, prem.process_premises and the association
+# sync for parsed premises, adding the calls and outcomes to the plan
+def plan_push(plan, premises, sales_rep_data, known, warm_caches=False):
+    fingerprints = load_pushed_properties()
+    resolved = {object_type: {} for object_type in OBJECT_KEYS}
+    new_links = Counter()
+
+    pushable = [premise for premise in premises if hub.is_pushable(premise)]
+    for customer_premises in hub.group_premises_by_customer(pushable):
+        primary = hub.select_primary_premise(customer_premises)
+        customer = primary.customer
+        contact_keys = [hub.email_key(customer.email)] if customer.email else []
+        contact_keys.append(str(primary.id))
+
+        contact_data = hub.build_contact_data(primary, customer)
+        contact_id = _plan_lookup(plan, "contacts", contact_keys, known["contacts"], resolved["contacts"], warm_caches)
+        if contact_id:
+            _plan_update(plan, "contacts", contact_id, contact_data["properties"], fingerprints)
+        else:
+            contact_id = f"new:{primary.id}"
+            plan.call("hubspot", "POST /crm/v3/objects/contacts")
+            plan.outcomes["contacts"]["create"] += 1
+        for premise in customer_premises:
+            resolved["contacts"][str(premise.id)] = contact_id
+        for key in contact_keys:
+            resolved["contacts"][key] = contact_id
+
+        for premise in customer_premises:
+            for service in premise.services:
+                for work_order in service.work_orders:
+                    pipeline = hub.get_ticket_pipeline(work_order)
+                    if pipeline is None:
+                        plan.outcomes["tickets"]["skipped"] += 1
+                        continue
+
+                    key = str(work_order.id)
+                    ticket_id = _plan_lookup(plan, "tickets", [key], known["tickets"], resolved["tickets"], warm_caches)
+                    if ticket_id:
+                        properties = hub.build_ticket_properties(work_order, premise, customer, sales_rep_data, pipeline)
+                        _plan_update(plan, "tickets", ticket_id, properties, fingerprints)
+                    else:
+                        # The ticket is linked to its contact inline when it is created
+                        ticket_id = f"new:{key}"
+                        plan.call("hubspot", "POST /crm/v3/objects/tickets")
+                        plan.outcomes["tickets"]["create"] += 1
+                        new_links[(prem.PREMISES_OBJECT_API_NAME, "tickets")] += 1
+                    resolved["tickets"][key] = ticket_id
+
+    object_type = prem.PREMISES_OBJECT_API_NAME
+    for premise in premises:
+        key = str(premise.id)
+        premises_id = _plan_lookup(plan, object_type, [key], known[object_type], resolved[object_type], warm_caches)
+        if premises_id:
+            _plan_update(plan, object_type, premises_id, prem.build_premises_properties(premise), fingerprints)
+        else:
+            premises_id = f"new:{key}"
+            plan.call("hubspot", f"POST /crm/v3/objects/{object_type}")
+            plan.outcomes[object_type]["create"] += 1
+            if key in resolved["contacts"]:
+                new_links[(object_type, "contacts")] += 1
+        resolved[object_type][key] = premises_id
+
+    if associations.SYNC_ASSOCIATIONS:
+        # Links between objects that already existed are assumed to be in place
+        sources = {
+            ("tickets", "contacts"): len(set(resolved["tickets"].values())),
+            (object_type, "contacts"): len({premise_key for premise_key in resolved[object_type] if premise_key in resolved["contacts"]}),
+            (object_type, "tickets"): len(set(resolved[object_type].values())),
+        }
+        for (from_type, to_type), count in sources.items():
+            plan.call("hubspot", f"POST /crm/v4/associations/{from_type}/{to_type}/batch/read",
+                      _batches(count, associations.ASSOCIATION_BATCH_SIZE))
+            operation = "create" if associations.ASSOCIATION_TYPES[(from_type, to_type)] else "associate/default"
+            plan.call("hubspot", f"POST /crm/v4/associations/{from_type}/{to_type}/batch/{operation}",
+                      _batches(new_links[(from_type, to_type)], associations.ASSOCIATION_BATCH_SIZE))
+
+# Plan a sync of an enriched snapshot
+def plan_snapshot(premises_data, sales_rep_data=None, warm_caches=False, work_orders_total=None):
+    if sales_rep_data is None:
+        sales_rep_data = hub.load_sales_rep_data()
+
+    premises = parse_premises(premises_data)
+    services = sum(len(premise.services or ()) for premise in premises)
+    work_orders = sum(len(service.work_orders) for premise in premises for service in premise.services or ())
+    customers = len({premise.customer_id for premise in premises})
+
+    plan = SyncPlan(len(premises))
+    plan_fetch(plan, len(premises), services, work_orders, customers, work_orders_total)
+    plan_push(plan, premises, sales_rep_data, load_known_ids(), warm_caches)
+    return plan
+
+# Plan a sync of a window from its premises total alone, assuming nothing exists locally
+def plan_totals(premises, services_per_premise=SERVICES_PER_PREMISE, work_orders_per_service=WORK_ORDERS_PER_SERVICE,
+                premises_per_customer=PREMISES_PER_CUSTOMER, work_orders_total=None):
+    services = round(premises * services_per_premise)
+    work_orders = round(services * work_orders_per_service)
+    customers = math.ceil(premises / premises_per_customer) if premises else 0
+
+    plan = SyncPlan(premises)
+    plan_fetch(plan, premises, services, work_orders, customers, work_orders_total)
+    for object_type, count in (("contacts", customers), ("tickets", work_orders), (prem.PREMISES_OBJECT_API_NAME, premises)):
+        plan.call("hubspot", f"POST /crm/v3/objects/{object_type}/search", count)
+        plan.call("hubspot", f"POST|PATCH /crm/v3/objects/{object_type}", count)
+        plan.outcomes[object_type]["create or update"] += count
+
+    if associations.SYNC_ASSOCIATIONS:
+        for (from_type, to_type), association_type in associations.ASSOCIATION_TYPES.items():
+            sources = work_orders if from_type == "tickets" else premises
+            plan.call("hubspot", f"POST /crm/v4/associations/{from_type}/{to_type}/batch/read",
+                      _batches(sources, associations.ASSOCIATION_BATCH_SIZE))
+            # Typed pairs (ticket-to-contact) are linked inline when the ticket is created,
+            # so only the default-type premises pairs need association writes
+            if association_type is None:
+                plan.call("hubspot", f"POST /crm/v4/associations/{from_type}/{to_type}/batch/associate/default",
+                          _batches(work_orders if to_type == "tickets" else premises, associations.ASSOCIATION_BATCH_SIZE))
+    return plan
+
+# Ask AEX for the number of premises updated in a window (a single page request)
+def fetch_premises_total(hours):
+    page = data.fetch_premises(data.get_updated_after(hours), page=1)
+    if page is None:
+        raise Exception("Could not read the premises total from AEX")
+    return page['total']
+
+# Ask AEX for the number of work orders the sweep would page through for a window
+# (a single page request)
+def fetch_work_orders_total(hours):
+    page = data.fetch_work_orders_page(data.get_updated_after(hours), page=1)
+    if page is None:
+        raise Exception("Could not read the work orders total from AEX")
+    return page.get('total', 0)
+
+# Seconds a number of calls takes: bound by latency spread over the concurrency, or by
+# the rate limit, whichever is slower
+def estimate_seconds(calls, latency_ms, rate_limit, concurrency=CONCURRENCY):
+    latency_bound = calls * latency_ms / 1000 / max(1, concurrency)
+    quota_bound = calls / rate_limit if rate_limit else 0
+    return max(latency_bound, quota_bound)
+
+# Estimated wall time per phase; the fetch runs before the HubSpot push
+def estimate_wall_time(plan, concurrency=CONCURRENCY):
+    aex_seconds = estimate_seconds(plan.total_calls("aex"), AEX_LATENCY_MS, AEX_RATE_LIMIT, concurrency)
+    hubspot_seconds = max(
+        estimate_seconds(plan.total_calls("hubspot"), HUBSPOT_LATENCY_MS, HUBSPOT_RATE_LIMIT, concurrency),
+        estimate_seconds(plan.search_calls(), HUBSPOT_LATENCY_MS, HUBSPOT_SEARCH_RATE_LIMIT, concurrency),
+    )
+    return {"aex": aex_seconds, "hubspot": hubspot_seconds, "total": aex_seconds + hubspot_seconds}
+
+def _format_duration(seconds):
+    hours, remainder = divmod(int(round(seconds)), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+# Human-readable report of a plan
+def format_plan(plan, concurrency=CONCURRENCY):
+    lines = [f"Plan for {plan.premises} premises"]
+    for api in ("aex", "hubspot"):
+        lines.append(f"  {api}: {plan.total_calls(api)} calls")
+        endpoints = sorted(((count, endpoint) for (call_api, endpoint), count in plan.calls.items() if call_api == api), reverse=True)
+        for count, endpoint in endpoints:
+            lines.append(f"    {count:>8}  {endpoint}")
+
+    lines.append("  outcomes:")
+    for object_type, outcomes in plan.outcomes.items():
+        lines.append(f"    {object_type:<12} " + "  ".join(f"{name}={count}" for name, count in sorted(outcomes.items())))
+
+    wall_time = estimate_wall_time(plan, concurrency)
+    lines.append(f"  wall time at concurrency {concurrency}: {_format_duration(wall_time['total'])} "
+                 f"(aex {_format_duration(wall_time['aex'])}, hubspot {_format_duration(wall_time['hubspot'])})")
+
+    hubspot_calls = plan.total_calls("hubspot")
+    lines.append(f"  hubspot daily budget: {hubspot_calls / HUBSPOT_DAILY_LIMIT:.1%} of {HUBSPOT_DAILY_LIMIT}")
+    if hubspot_calls and plan.premises:
+        premises_per_day = int(HUBSPOT_DAILY_LIMIT / (hubspot_calls / plan.premises))
+        lines.append(f"  premises per day within the budget at this mix: {premises_per_day}")
+    return lines
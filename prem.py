@@ -1,18 +1,35 @@
-import requests
 import json
 import os
 
-# HubSpot Private App Access Token (replace with your actual token)
-HUBSPOT_ACCESS_TOKEN = os.getenv('HUBSPOT_ACCESS_TOKEN')
+import dead_letter
+import hubspot_api
+import tracing
+from hubspot_api import session
+from models import parse_premises
+from property_diff import changed_properties, record_pushed, save_pushed_properties
 
 # Custom object API name in HubSpot for Premises
 PREMISES_OBJECT_API_NAME = "2-34057446"  # Update with the actual API name of your custom object
 
-# Headers for HubSpot API requests
-HUBSPOT_HEADERS = {
-    "Authorization": f"Bearer {HUBSPOT_ACCESS_TOKEN}",
-    "Content-Type": "application/json"
-}
+_hubspot_headers = None
+
+# HubSpot premises object IDs resolved earlier in this process, keyed by str(premise_id)
+premises_ids = {}
+
+# Build the HubSpot request headers from the Private App Access Token on first use
+def get_hubspot_headers():
+    global _hubspot_headers
+    if _hubspot_headers is None:
+        hubspot_access_token = os.getenv('HUBSPOT_ACCESS_TOKEN')
+
+        if not hubspot_access_token:
+            raise Exception("HUBSPOT_ACCESS_TOKEN environment variable is not set")
+
+        _hubspot_headers = {
+            "Authorization": f"Bearer {hubspot_access_token}",
+            "Content-Type": "application/json"
+        }
+    return _hubspot_headers
 
 # Load premises data from JSON file
 def load_premises_data(filename="enriched_premises_data.json"):
@@ -20,8 +37,13 @@ def load_premises_data(filename="enriched_premises_data.json"):
         return json.load(json_file)
 
 # Check if a premises custom object exists in HubSpot using its premise_id
+@tracing.traced("hubspot.find_premises", premise_id="premise_id")
 def find_existing_premises(premise_id):
-    url = f"https://api.hubapi.com/crm/v3/objects/{PREMISES_OBJECT_API_NAME}/search"
+    tracing.current_span().set_attribute("cache_hit", str(premise_id) in premises_ids)
+    if str(premise_id) in premises_ids:
+        return premises_ids[str(premise_id)]
+
+    url = f"{hubspot_api.BASE_URL}/crm/v3/objects/{PREMISES_OBJECT_API_NAME}/search"
     query = {
         "filterGroups": [{
             "filters": [{
@@ -32,86 +54,109 @@ def find_existing_premises(premise_id):
         }]
     }
 
-    response = requests.post(url, headers=HUBSPOT_HEADERS, json=query)
+    response = session.post(url, headers=get_hubspot_headers(), json=query)
     
     if response.status_code == 200:
         data = response.json()
         if data['results']:
-            return data['results'][0]['id']  # Return the existing premises ID in HubSpot
+            premises_ids[str(premise_id)] = data['results'][0]['id']
+            return premises_ids[str(premise_id)]  # Return the existing premises ID in HubSpot
         return None
     else:
         print(f"Error searching for premise: {response.text}")
         return None
 
+# Build the premises properties HubSpot holds for a premise
+@tracing.traced("hubspot.build_premises_properties", premise_id="premise.id")
+def build_premises_properties(premise):
+    return {
+        "city": premise.city,
+        "state": premise.province,
+        "postal_code": premise.postal_code,
+        "latitude": premise.latitude,
+        "longitude": premise.longitude,
+        "status": premise.status,
+        "address": premise.address  # Use street number and street name as address
+    }
+
 # Create a new premises custom object in HubSpot
+@tracing.traced("hubspot.create_premises", premise_id="premise.id")
 def create_premises(premise):
-    url = f"https://api.hubapi.com/crm/v3/objects/{PREMISES_OBJECT_API_NAME}"
-
-    # Address should be street number and street name
-    address = f"{premise.get('street_number', '')} {premise.get('street_name', '')}"
+    url = f"{hubspot_api.BASE_URL}/crm/v3/objects/{PREMISES_OBJECT_API_NAME}"
 
     premises_data = {
         "properties": {
-            "premise_id": premise.get('id'),  # Store the premise ID as premise_id in HubSpot
-            "city": premise.get('city', ''),
-            "state": premise.get('province', ''),
-            "postal_code": premise.get('postal_code', ''),
-            "latitude": premise.get('latitude', ''),
-            "longitude": premise.get('longitude', ''),
-            "status": premise.get('status', ''),
-            "address": address  # Use street number and street name as address
+            "premise_id": premise.id,  # Store the premise ID as premise_id in HubSpot
+            **build_premises_properties(premise)
         }
     }
 
-    response = requests.post(url, headers=HUBSPOT_HEADERS, json=premises_data)
+    response = session.post(url, headers=get_hubspot_headers(), json=premises_data)
 
     if response.status_code == 201:
-        print(f"Premises {premise.get('id')} created successfully.")
+        print(f"Premises {premise.id} created successfully.")
+        premises_id = response.json().get('id')
+        record_pushed(PREMISES_OBJECT_API_NAME, premises_id, premises_data["properties"])
+        if premises_id:
+            premises_ids[str(premise.id)] = premises_id
+        dead_letter.resolve(PREMISES_OBJECT_API_NAME, "create", premise.id)
     else:
         print(f"Error creating premises: {response.text}")
+        dead_letter.record_failure(PREMISES_OBJECT_API_NAME, "create", premise.id, premises_data, response.text, response.status_code)
 
 # Update an existing premises custom object in HubSpot
+@tracing.traced("hubspot.update_premises", premises_id="premises_id", premise_id="premise.id")
 def update_premises(premises_id, premise):
-    url = f"https://api.hubapi.com/crm/v3/objects/{PREMISES_OBJECT_API_NAME}/{premises_id}"
-
-    # Address should be street number and street name
-    address = f"{premise.get('street_number', '')} {premise.get('street_name', '')}"
+    url = f"{hubspot_api.BASE_URL}/crm/v3/objects/{PREMISES_OBJECT_API_NAME}/{premises_id}"
 
     premises_data = {
-        "properties": {
-            "city": premise.get('city', ''),
-            "state": premise.get('province', ''),
-            "postal_code": premise.get('postal_code', ''),
-            "latitude": premise.get('latitude', ''),
-            "longitude": premise.get('longitude', ''),
-            "status": premise.get('status', ''),
-            "address": address  # Use street number and street name as address
-        }
+        "properties": build_premises_properties(premise)
     }
 
-    response = requests.patch(url, headers=HUBSPOT_HEADERS, json=premises_data)
+    # Only send the properties that differ from what HubSpot already holds
+    properties = changed_properties(PREMISES_OBJECT_API_NAME, premises_id, premises_data["properties"])
+    if not properties:
+        print(f"Premises {premise.id} is unchanged, skipping update.")
+        tracing.current_span().set_attribute("unchanged", True)
+        dead_letter.resolve(PREMISES_OBJECT_API_NAME, "update", premises_id)
+        return
+    premises_data["properties"] = properties
+
+    response = session.patch(url, headers=get_hubspot_headers(), json=premises_data)
 
     if response.status_code == 200:
-        print(f"Premises {premise.get('id')} updated successfully.")
+        print(f"Premises {premise.id} updated successfully.")
+        record_pushed(PREMISES_OBJECT_API_NAME, premises_id, properties)
+        dead_letter.resolve(PREMISES_OBJECT_API_NAME, "update", premises_id)
     else:
         print(f"Error updating premises {premises_id}: {response.text}")
+        if response.status_code == 404:
+            premises_ids.pop(str(premise.id), None)
+        else:
+            dead_letter.record_failure(PREMISES_OBJECT_API_NAME, "update", premises_id, premises_data, response.text, response.status_code)
 
 # Process premises data to create or update premises in HubSpot
-def process_premises():
-    premises_data = load_premises_data()
-
-    for premise in premises_data:
-        premise_id = premise.get('id')  # Use the 'id' from the premises data as 'premise_id' in HubSpot
-
-        # Check if the premises already exists in HubSpot
-        existing_premises_id = find_existing_premises(premise_id)
-
-        if existing_premises_id:
-            # Update the existing premises custom object
-            update_premises(existing_premises_id, premise)
-        else:
-            # Create a new premises custom object
-            create_premises(premise)
+def process_premises(premises_data=None):
+    if premises_data is None:
+        premises_data = load_premises_data()
+
+    for premise in parse_premises(premises_data):
+        premise_id = premise.id  # Use the 'id' from the premises data as 'premise_id' in HubSpot
+
+        with tracing.premise_span("hubspot.push_premises_object", premise_id):
+            # Check if the premises already exists in HubSpot
+            existing_premises_id = find_existing_premises(premise_id)
+
+            if existing_premises_id:
+                # It exists, so an earlier failed create of it must not be replayed
+                dead_letter.resolve(PREMISES_OBJECT_API_NAME, "create", premise_id)
+                # Update the existing premises custom object
+                update_premises(existing_premises_id, premise)
+            else:
+                # Create a new premises custom object
+                create_premises(premise)
+
+    save_pushed_properties()
 
 # Run the main function
 if __name__ == "__main__":
@@ -0,0 +1,102 @@
+import os
+import json
+import logging
+from datetime import datetime
+
+import tracing
+
+# How update calls decide which properties to send:
+#   "full"  - always PATCH the full property set (previous behaviour)
+#   "cache" - diff against the locally cached last-pushed copy, sending the full property
+#             set on a cache miss (the push then fills the cache for the next run)
+# The cache holds what was last pushed, not what HubSpot holds now; a reconcile reads
+# HubSpot's actual values in bulk and refreshes it.
+PATCH_MODE = os.getenv('HUBSPOT_PATCH_MODE', 'cache')
+
+# Local copy of the properties last pushed to HubSpot, keyed by "<object_type>:<object_id>"
+PUSHED_PROPERTIES_FILE = "pushed_properties.json"
+
+_pushed_properties = None
+
+# Load the last-pushed properties cache (once per process)
+def load_pushed_properties(filename=PUSHED_PROPERTIES_FILE):
+    global _pushed_properties
+    if _pushed_properties is None:
+        if os.path.exists(filename):
+            try:
+                with open(filename, 'r') as json_file:
+                    _pushed_properties = json.load(json_file)
+            except ValueError:
+                logging.error(f"Invalid pushed properties cache {filename}, starting empty.")
+                _pushed_properties = {}
+        else:
+            _pushed_properties = {}
+    return _pushed_properties
+
+# Save the last-pushed properties cache (overwrites the file each time)
+def save_pushed_properties(filename=PUSHED_PROPERTIES_FILE):
+    if _pushed_properties is None:
+        return
+    with open(filename, 'w') as json_file:
+        json.dump(_pushed_properties, json_file)
+
+# Normalize a property value to the string form HubSpot returns it in
+def normalize_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+# Convert a HubSpot datetime string (e.g. 2024-05-01T10:00:00.000Z) to milliseconds, if it is one
+def _datetime_to_milliseconds(value):
+    try:
+        return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000)
+    except (ValueError, AttributeError):
+        return None
+
+# Check whether an outgoing property value differs from the value HubSpot holds
+def values_differ(outgoing, current):
+    outgoing_value = normalize_value(outgoing)
+    current_value = normalize_value(current)
+    if outgoing_value == current_value:
+        return False
+
+    # Datetime properties are sent as epoch milliseconds but read back as ISO strings
+    if isinstance(outgoing, int) and not isinstance(outgoing, bool) and 'T' in current_value:
+        return _datetime_to_milliseconds(current_value) != outgoing
+    return True
+
+# Return only the outgoing properties whose values differ from the current ones
+def diff_properties(outgoing, current):
+    return {
+        name: value
+        for name, value in outgoing.items()
+        if name not in current or values_differ(value, current[name])
+    }
+
+# Work out which properties an update to an existing object actually needs to send
+@tracing.traced("hubspot.changed_properties", object_type="object_type", object_id="object_id")
+def changed_properties(object_type, object_id, properties):
+    if PATCH_MODE == 'full':
+        return properties
+
+    # A miss is not worth a read of its own: a full PATCH costs the same one call
+    current = load_pushed_properties().get(f"{object_type}:{object_id}")
+    if current is None:
+        # Nothing to compare against, so fall back to sending everything
+        return properties
+
+    return diff_properties(properties, current)
+
+# Remember the properties just pushed for an object so the next run can diff against them
+def record_pushed(object_type, object_id, properties):
+    if object_id is None:
+        return
+    cache = load_pushed_properties()
+    key = f"{object_type}:{object_id}"
+    cached = cache.setdefault(key, {})
+    for name, value in properties.items():
+        cached[name] = normalize_value(value)
@@ -0,0 +1,265 @@
+import json
+import logging
+
+import dead_letter
+import hub
+import hubspot_api
+import prem
+from hubspot_api import session
+from models import parse_premises
+from property_diff import diff_properties, record_pushed, save_pushed_properties
+
+# Full reconciliation between a complete AEX snapshot and HubSpot. Instead of searching
+# record by record, every contact, ticket and premises object is read with HubSpot's
+# cursor-paged list endpoint (only the properties this sync manages), matched to the
+# snapshot by its AEX key, and only the differences are written back through the batch
+# create/update endpoints. Objects that exist only in HubSpot are reported, never deleted.
+
+# HubSpot returns at most 100 objects per list page and accepts 100 inputs per batch
+LIST_PAGE_SIZE = 100
+BATCH_SIZE = 100
+
+# Property holding the AEX key each object type is matched on
+OBJECT_KEYS = {
+    "contacts": "aex_id",
+    "tickets": "work_order_id1",
+    prem.PREMISES_OBJECT_API_NAME: "premise_id",
+}
+
+# Read every object of a type, following the paging cursor. Returns {object ID: properties}.
+def list_all_objects(object_type, property_names, headers):
+    url = f"{hubspot_api.BASE_URL}/crm/v3/objects/{object_type}"
+    params = {"limit": LIST_PAGE_SIZE, "properties": ",".join(sorted(property_names)), "archived": "false"}
+    objects = {}
+    while True:
+        response = session.get(url, headers=headers, params=params)
+        if response.status_code != 200:
+            raise Exception(f"Error listing {object_type}: {response.status_code} {response.text}")
+        page = response.json()
+        for result in page.get('results', []):
+            objects[str(result['id'])] = result.get('properties', {})
+
+        after = page.get('paging', {}).get('next', {}).get('after')
+        if not after:
+            return objects
+        params["after"] = after
+
+# Build the properties HubSpot should hold for every object the snapshot implies.
+# Returns {object type: {AEX key: properties}}, the inputs needed to create tickets, and
+# the contact key (primary premise ID) each premise's tickets belong to.
+def expected_objects(premises, sales_rep_data):
+    expected = {object_type: {} for object_type in OBJECT_KEYS}
+    tickets_to_build = {}  # work order ID -> (premise, work order, pipeline), for creates
+    no_ticket_stage = {}   # work order ID -> status, for work orders that map to no ticket stage
+    contact_keys = {}      # premise ID -> key of the contact it is grouped under
+
+    for premise in premises:
+        expected[prem.PREMISES_OBJECT_API_NAME][str(premise.id)] = {
+            "premise_id": premise.id,
+            **prem.build_premises_properties(premise)
+        }
+
+    # Contacts follow the regular push: one per customer, built from its primary premise
+    pushable = [premise for premise in premises if hub.is_pushable(premise)]
+    for customer_premises in hub.group_premises_by_customer(pushable):
+        primary = hub.select_primary_premise(customer_premises)
+        expected["contacts"][str(primary.id)] = hub.build_contact_data(primary, primary.customer)["properties"]
+
+        for premise in customer_premises:
+            contact_keys[str(premise.id)] = str(primary.id)
+            for service in premise.services:
+                for work_order in service.work_orders:
+                    pipeline = hub.get_ticket_pipeline(work_order)
+                    if pipeline is None:
+                        no_ticket_stage[str(work_order.id)] = work_order.status
+                        continue
+                    expected["tickets"][str(work_order.id)] = hub.build_ticket_properties(
+                        work_order, premise, premise.customer, sales_rep_data, pipeline
+                    )
+                    tickets_to_build[str(work_order.id)] = (premise, work_order, pipeline)
+
+    return expected, tickets_to_build, contact_keys, no_ticket_stage
+
+# Match HubSpot objects to expected ones by AEX key and work out the minimal corrections
+def plan_corrections(object_type, expected, current):
+    key_property = OBJECT_KEYS[object_type]
+    by_key = {}
+    by_email = {}
+    for object_id, properties in current.items():
+        key = properties.get(key_property)
+        if key not in (None, ''):
+            by_key.setdefault(str(key), object_id)
+        if object_type == 'contacts' and properties.get('email'):
+            by_email.setdefault(hub.email_key(properties['email']), object_id)
+
+    updates, creates, matched = [], [], {}
+    for key, properties in expected.items():
+        object_id = by_key.get(key)
+        if object_id is None and object_type == 'contacts':
+            # Contacts are also matched on email, like the regular push does
+            if properties.get('email'):
+                object_id = by_email.get(hub.email_key(properties['email']))
+        if object_id is None:
+            creates.append((key, properties))
+            continue
+
+        matched[key] = object_id
+        changes = diff_properties(properties, current[object_id])
+        if 'email' in changes and current[object_id].get('email') and \
+                hub.email_key(changes['email']) == hub.email_key(current[object_id]['email']):
+            del changes['email']  # Only differs in case (or whitespace), which HubSpot does not keep
+        if changes:
+            updates.append((key, object_id, changes))
+
+    matched_ids = set(matched.values())
+    extra = [object_id for object_id in current if object_id not in matched_ids]
+    return {"updates": updates, "creates": creates, "matched": matched, "extra": extra}
+
+# Send inputs through a batch endpoint in chunks; returns the results HubSpot reported
+def send_batches(object_type, operation, inputs, headers, batch_size=BATCH_SIZE):
+    url = f"{hubspot_api.BASE_URL}/crm/v3/objects/{object_type}/batch/{operation}"
+    results = []
+    for start in range(0, len(inputs), batch_size):
+        batch = inputs[start:start + batch_size]
+        response = dead_letter.send_with_backoff("POST", url, headers, {"inputs": batch}, base_delay=1.0)
+        if response is not None and response.status_code in (200, 201, 207):
+            results.extend(response.json().get('results', []))
+            if response.status_code == 207:
+                logging.error(f"Partial failure in {object_type} batch {operation}: {response.text}")
+        else:
+            logging.error(f"Error in {object_type} batch {operation}: {response.text if response is not None else 'No response'}")
+        logging.info(f"Sent {object_type} batch {operation} of {len(batch)}.")
+    return results
+
+# Apply planned updates; failed ones go to the dead-letter store. Returns the number applied.
+def apply_updates(object_type, updates, headers, batch_size=BATCH_SIZE):
+    inputs = [{"id": object_id, "properties": changes} for _, object_id, changes in updates]
+    done = {str(result.get('id')) for result in send_batches(object_type, "update", inputs, headers, batch_size)}
+    for _, object_id, changes in updates:
+        if object_id in done:
+            record_pushed(object_type, object_id, changes)
+            dead_letter.resolve(object_type, "update", object_id)
+        else:
+            dead_letter.record_failure(object_type, "update", object_id, {"properties": changes}, "Reconciliation update failed")
+    return len(done)
+
+# Apply planned creates; failed ones go to the dead-letter store. Returns {AEX key: new object ID}.
+def apply_creates(object_type, creates, headers, batch_size=BATCH_SIZE):
+    key_property = OBJECT_KEYS[object_type]
+    results = send_batches(object_type, "create", [payload for _, payload in creates], headers, batch_size)
+    created = {}
+    for result in results:
+        key = result.get('properties', {}).get(key_property)
+        if key not in (None, ''):
+            created[str(key)] = str(result['id'])
+
+    for key, payload in creates:
+        if key in created:
+            record_pushed(object_type, created[key], payload.get('properties', {}))
+            remember_id(object_type, key, created[key], payload.get('properties', {}))
+            dead_letter.resolve(object_type, "create", key)
+        else:
+            dead_letter.record_failure(object_type, "create", key, payload, "Reconciliation create failed")
+    return created
+
+# Remember the HubSpot ID of an object in the ID cache the regular push uses
+def remember_id(object_type, key, object_id, properties):
+    if object_type == 'contacts':
+        hub.remember_contact_id(properties.get('email'), key, object_id)
+    elif object_type == 'tickets':
+        hub.ticket_ids[key] = object_id
+    else:
+        prem.premises_ids[key] = object_id
+
+# Remember the HubSpot IDs and values read during reconciliation, so the regular push
+# (and a resident daemon) can skip searches and diff against HubSpot's actual state
+def seed_caches(object_type, plan, current):
+    for key, object_id in plan["matched"].items():
+        record_pushed(object_type, object_id, current[object_id])
+        remember_id(object_type, key, object_id, current[object_id])
+
+# Reconcile HubSpot against a full enriched snapshot. With dry_run the corrections are only
+# planned (and written to output_file if given). Returns a summary per object type.
+def reconcile(premises_data, sales_rep_data=None, dry_run=False, output_file=None, batch_size=BATCH_SIZE):
+    if sales_rep_data is None:
+        sales_rep_data = hub.load_sales_rep_data()
+    headers = hub.get_hubspot_headers()
+
+    premises = parse_premises(premises_data)
+    expected, tickets_to_build, contact_keys, no_ticket_stage = expected_objects(premises, sales_rep_data)
+
+    summary = {}
+    plans = {}
+    currents = {}
+    # Contacts first: new tickets need the IDs of their contacts
+    for object_type in ("contacts", prem.PREMISES_OBJECT_API_NAME, "tickets"):
+        property_names = {OBJECT_KEYS[object_type]}
+        for properties in expected[object_type].values():
+            property_names.update(properties)
+        if object_type == 'contacts':
+            property_names.add('email')
+
+        currents[object_type] = list_all_objects(object_type, property_names, headers)
+        plans[object_type] = plan_corrections(object_type, expected[object_type], currents[object_type])
+        plan = plans[object_type]
+        if object_type == 'tickets':
+            # Tickets of work orders that have since become cancelled (or got a status with no
+            # ticket stage) are known to the snapshot; report them apart from unknown extras.
+            # They have no stage to be corrected to, so they are left as they are.
+            plan["no_ticket_stage"], extra = [], []
+            for object_id in plan["extra"]:
+                key = str(currents[object_type][object_id].get(OBJECT_KEYS[object_type]) or '')
+                if key in no_ticket_stage:
+                    plan["no_ticket_stage"].append((key, object_id))
+                else:
+                    extra.append(object_id)
+            plan["extra"] = extra
+        summary[object_type] = {
+            "in_hubspot": len(currents[object_type]),
+            "in_snapshot": len(expected[object_type]),
+            "to_update": len(plan["updates"]),
+            "to_create": len(plan["creates"]),
+            "only_in_hubspot": len(plan["extra"]),
+        }
+        if object_type == 'tickets':
+            summary[object_type]["no_ticket_stage"] = len(plan["no_ticket_stage"])
+        logging.info(f"Reconciling {object_type}: {summary[object_type]}")
+
+    if output_file:
+        with open(output_file, 'w') as corrections_file:
+            for object_type, plan in plans.items():
+                for key, object_id, changes in plan["updates"]:
+                    corrections_file.write(json.dumps({"object_type": object_type, "operation": "update", "key": key, "id": object_id, "properties": changes}) + "\n")
+                for key, properties in plan["creates"]:
+                    corrections_file.write(json.dumps({"object_type": object_type, "operation": "create", "key": key, "properties": properties}) + "\n")
+                for key, object_id in plan.get("no_ticket_stage", []):
+                    corrections_file.write(json.dumps({"object_type": object_type, "operation": "none", "key": key, "id": object_id, "status": no_ticket_stage[key]}) + "\n")
+
+    if dry_run:
+        return summary
+
+    contact_ids = dict(plans["contacts"]["matched"])
+    for object_type in ("contacts", prem.PREMISES_OBJECT_API_NAME, "tickets"):
+        plan = plans[object_type]
+        seed_caches(object_type, plan, currents[object_type])
+        summary[object_type]["updated"] = apply_updates(object_type, plan["updates"], headers, batch_size)
+
+        if object_type == 'tickets':
+            creates = []
+            for key, _ in plan["creates"]:
+                premise, work_order, pipeline = tickets_to_build[key]
+                contact_id = contact_ids.get(contact_keys[str(premise.id)])
+                if contact_id is None:
+                    logging.error(f"No contact for premise {premise.id}, cannot create ticket for work order {key}.")
+                    continue
+                creates.append((key, hub.build_ticket_data(contact_id, work_order, premise, premise.customer, sales_rep_data, pipeline)))
+        else:
+            creates = [(key, {"properties": properties}) for key, properties in plan["creates"]]
+
+        created = apply_creates(object_type, creates, headers, batch_size)
+        summary[object_type]["created"] = len(created)
+        if object_type == 'contacts':
+            contact_ids.update(created)
+
+    save_pushed_properties()
+    return summary
@@ -0,0 +1,68 @@
+import os
+import sys
+import copy
+import shutil
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import data
+import hub
+import prem
+import dead_letter
+import hubspot_api
+import property_diff
+from benchmarks.fake_servers import FaultConfig, start_fake_aex, start_fake_hubspot
+from benchmarks.synthetic import generate_snapshot
+
+REFERENCE_FILES = ["id.csv", "ticket_types.json"]
+
+# Run each test in a scratch directory with empty caches and its own dead-letter store
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    for filename in REFERENCE_FILES:
+        shutil.copy(os.path.join(REPO_DIR, filename), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('API_TOKEN', 'test')
+    monkeypatch.setenv('HUBSPOT_ACCESS_TOKEN', 'test')
+
+    monkeypatch.setattr(hub, 'contact_ids', {})
+    monkeypatch.setattr(hub, 'ticket_ids', {})
+    monkeypatch.setattr(prem, 'premises_ids', {})
+    monkeypatch.setattr(property_diff, '_pushed_properties', None)
+    monkeypatch.setattr(dead_letter, 'DEAD_LETTER_DB', str(tmp_path / "dead_letter.db"))
+    monkeypatch.setattr(dead_letter, '_pending_keys', None)
+    return tmp_path
+
+@pytest.fixture
+def snapshot():
+    return generate_snapshot(premises=12, services_per_premise=2, work_orders_per_service=2, shared_customer_ratio=0.25, seed=7)
+
+def _start_aex(snapshot, monkeypatch, faults=None):
+    server = start_fake_aex(copy.deepcopy(snapshot), faults)
+    monkeypatch.setattr(data, 'BASE_URL', server.base_url)
+    return server
+
+@pytest.fixture
+def fake_aex(snapshot, workdir, monkeypatch):
+    server = _start_aex(snapshot, monkeypatch)
+    yield server
+    server.stop()
+
+# An AEX that answers every request with a 500
+@pytest.fixture
+def failing_aex(snapshot, workdir, monkeypatch):
+    server = _start_aex(snapshot, monkeypatch, FaultConfig(error_rate=1.0))
+    yield server
+    server.stop()
+
+@pytest.fixture
+def fake_hubspot(workdir, monkeypatch):
+    server = start_fake_hubspot()
+    monkeypatch.setattr(hubspot_api, 'BASE_URL', server.base_url)
+    # Replays back off on failures; keep tests fast
+    monkeypatch.setattr(dead_letter, 'REPLAY_RETRIES', 0)
+    yield server
+    server.stop()
@@ -0,0 +1,17 @@
+import associations
+
+TYPE = {"associationCategory": "USER_DEFINED", "associationTypeId": 7}
+
+def test_missing_associations_without_a_type():
+    desired = {("2", "20"), ("1", "10"), ("1", "11")}
+    existing = {"1": {"10": [1]}, "2": {}}
+    assert associations.missing_associations(desired, existing, None) == [("1", "11"), ("2", "20")]
+
+def test_missing_associations_need_the_configured_type():
+    desired = {("1", "10"), ("2", "20")}
+    existing = {"1": {"10": [1]}, "2": {"20": [1, 7]}}
+    assert associations.missing_associations(desired, existing, TYPE) == [("1", "10")]
+
+def test_nothing_missing():
+    assert associations.missing_associations({("1", "10")}, {"1": {"10": [7]}}, TYPE) == []
+    assert associations.missing_associations(set(), {}, None) == []
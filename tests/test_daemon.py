@@ -0,0 +1,22 @@
+import pytest
+
+import data
+import hub
+import daemon
+import associations
+
+UPDATED_AFTER = "2020-01-01 00:00:00"
+
+def test_failed_fetch_keeps_the_window(failing_aex):
+    assert daemon.poll(UPDATED_AFTER, hub.load_sales_rep_data(), hub.load_ticket_types()) == UPDATED_AFTER
+    assert failing_aex.stats.statuses[500] > 0
+
+def test_failed_fetch_raises_instead_of_returning_partial_data(failing_aex):
+    with pytest.raises(data.FetchError):
+        data.fetch_and_enrich(UPDATED_AFTER, require_complete=True)
+
+def test_complete_window_advances(fake_aex, fake_hubspot, monkeypatch):
+    monkeypatch.setattr(associations, 'SYNC_ASSOCIATIONS', False)
+    next_window = daemon.poll(UPDATED_AFTER, hub.load_sales_rep_data(), hub.load_ticket_types())
+    assert next_window > UPDATED_AFTER
+    assert fake_hubspot.stats.total > 0
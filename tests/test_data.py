@@ -0,0 +1,139 @@
+import io
+import os
+import sys
+import time
+import contextlib
+import subprocess
+
+import pytest
+
+import hub
+import data
+import prem
+import planner
+
+UPDATED_AFTER = "2020-01-01 00:00:00"
+
+def _fetch_and_enrich():
+    with contextlib.redirect_stdout(io.StringIO()):
+        return data.fetch_and_enrich(UPDATED_AFTER)
+
+def _work_order_ids(enriched):
+    return {
+        premise['id']: sorted(work_order['id'] for service in premise['services'] for work_order in service['work_orders']['items'])
+        for premise in enriched
+    }
+
+def _service_count(enriched):
+    return sum(len(premise['services']) for premise in enriched)
+
+def test_bulk_sweep_pages_work_orders_instead_of_one_call_per_service(fake_aex, monkeypatch):
+    monkeypatch.setattr(data, 'PAGE_SIZE', 5)
+    monkeypatch.setattr(data, 'ENRICHMENT_STRATEGY', 'bulk')
+    enriched = _fetch_and_enrich()
+    time.sleep(0.1)  # the fake records a call after writing its response
+
+    kept = [work_order for work_order in fake_aex.api.work_orders if work_order['status'] not in data.EXCLUDED_WORK_ORDER_STATUSES]
+    assert fake_aex.stats.calls["GET /work-orders"] == planner._page_requests(len(kept), data.PAGE_SIZE)
+    assert fake_aex.stats.calls["GET /work-orders"] < _service_count(enriched)
+
+def test_per_service_strategy_calls_work_orders_once_per_service(fake_aex, monkeypatch):
+    monkeypatch.setattr(data, 'ENRICHMENT_STRATEGY', 'bulk')
+    bulk = _fetch_and_enrich()
+    time.sleep(0.1)
+
+    monkeypatch.setattr(data, 'ENRICHMENT_STRATEGY', 'per_service')
+    before = fake_aex.stats.calls["GET /work-orders"]
+    per_service = _fetch_and_enrich()
+    time.sleep(0.1)
+
+    assert fake_aex.stats.calls["GET /work-orders"] - before == _service_count(per_service)
+    assert _work_order_ids(per_service) == _work_order_ids(bulk)
+
+def test_failed_sweep_falls_back_to_per_service_fetches(fake_aex, monkeypatch):
+    monkeypatch.setattr(data, 'ENRICHMENT_STRATEGY', 'bulk')
+    expected = _fetch_and_enrich()
+
+    monkeypatch.setattr(data, 'fetch_work_orders_page', lambda updated_after, page=1: None)
+    fetched_per_service = []
+    fetch_work_orders = data.fetch_work_orders
+    def record_fetch(service_id):
+        fetched_per_service.append(service_id)
+        return fetch_work_orders(service_id)
+    monkeypatch.setattr(data, 'fetch_work_orders', record_fetch)
+    enriched = _fetch_and_enrich()
+
+    assert len(fetched_per_service) == _service_count(enriched)
+    assert _work_order_ids(enriched) == _work_order_ids(expected)
+
+def test_projection_keeps_only_the_declared_fields(monkeypatch):
+    monkeypatch.setattr(data, 'KEEP_RAW_PAYLOADS', False)
+    response = {
+        "full_service": {
+            "service": {"id": 1, "status": "active", "internal_ref": "x"},
+            "isp_product": {"id": 2, "name": "Fibre 100", "price": 99},
+            "network": {"olt": "a"},
+        },
+    }
+    assert data.project(response, data.SERVICE_DETAILS_PROJECTION) == {
+        "full_service": {"service": {"id": 1, "status": "active"}, "isp_product": {"id": 2, "name": "Fibre 100"}},
+    }
+
+    page = {"total": 1, "page": 1, "items": [{"id": 5, "status": "active", "assignee": {"id": 9}}]}
+    assert data.project(page, data.WORK_ORDERS_PAGE_PROJECTION) == {"total": 1, "items": [{"id": 5, "status": "active"}]}
+
+def test_keep_raw_payloads_keeps_every_field(fake_aex, monkeypatch):
+    for premise in fake_aex.api.premises:
+        premise['internal_notes'] = "not used downstream"
+
+    monkeypatch.setattr(data, 'KEEP_RAW_PAYLOADS', False)
+    assert all('internal_notes' not in premise for premise in _fetch_and_enrich())
+
+    monkeypatch.setattr(data, 'KEEP_RAW_PAYLOADS', True)
+    assert all(premise['internal_notes'] == "not used downstream" for premise in _fetch_and_enrich())
+
+# Every AEX call goes through data.session, so a whole fetch reuses one kept-alive connection
+def test_fetch_reuses_one_pooled_connection(fake_aex):
+    _fetch_and_enrich()
+    time.sleep(0.1)
+
+    pool_manager = data.session.get_adapter(fake_aex.base_url).poolmanager
+    port = fake_aex.server_address[1]
+    pools = [pool_manager.pools[key] for key in pool_manager.pools.keys() if key.key_port == port]
+    assert fake_aex.stats.total > 1
+    assert [pool.num_connections for pool in pools] == [1]
+
+def test_query_params_push_down_page_size_and_excluded_statuses(monkeypatch):
+    monkeypatch.setattr(data, 'PAGE_SIZE', 200)
+    assert data.build_query_params(updated_after=UPDATED_AFTER, page=2, exclude_statuses=["cancelled", "void"], service=7) == {
+        "service": 7, "updated_after": UPDATED_AFTER, "page": 2, "per_page": 200, "status_not": "cancelled,void",
+    }
+    assert data.build_query_params(service=7) == {"service": 7}
+
+def test_excluded_statuses_are_dropped_again_locally():
+    work_orders = [{"id": 1, "status": "Cancelled "}, {"id": 2, "status": "in progress"}, {"id": 3, "status": "no such status"}]
+    with contextlib.redirect_stdout(io.StringIO()):
+        assert [work_order["id"] for work_order in data.filter_work_orders(work_orders)] == [2, 3]
+
+# Credentials are read on the first call, not at import, so commands that need no API load without them
+def test_modules_import_without_credentials():
+    env = {name: value for name, value in os.environ.items() if name not in ('API_TOKEN', 'HUBSPOT_ACCESS_TOKEN')}
+    subprocess.run([sys.executable, "-c", "import data, hub, prem, reconcile, associations, planner"], cwd=os.path.dirname(os.path.abspath(data.__file__)), env=env, check=True)
+
+@pytest.mark.parametrize("module, get_headers, cache, variable", [
+    (data, "get_headers", "_headers", "API_TOKEN"),
+    (hub, "get_hubspot_headers", "_hubspot_headers", "HUBSPOT_ACCESS_TOKEN"),
+    (prem, "get_hubspot_headers", "_hubspot_headers", "HUBSPOT_ACCESS_TOKEN"),
+])
+def test_headers_are_built_once_on_first_use(module, get_headers, cache, variable, monkeypatch):
+    monkeypatch.setattr(module, cache, None)
+    monkeypatch.delenv(variable, raising=False)
+    with pytest.raises(Exception, match=f"{variable} environment variable is not set"):
+        getattr(module, get_headers)()
+
+    monkeypatch.setenv(variable, "secret")
+    headers = getattr(module, get_headers)()
+    assert headers["Authorization"] == "Bearer secret"
+
+    monkeypatch.setenv(variable, "rotated")
+    assert getattr(module, get_headers)() is headers
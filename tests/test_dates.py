@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+import dates
+from dates import Date, EMPTY_DATE, normalize_date
+
+@pytest.fixture
+def aex_timezone(monkeypatch):
+    def configure(name):
+        monkeypatch.setattr(dates, 'AEX_TIMEZONE', name)
+        monkeypatch.setattr(dates, '_timezone', None)
+        normalize_date.cache_clear()
+
+    yield configure
+    normalize_date.cache_clear()
+
+# Switch the host's local timezone for the duration of a test
+@pytest.fixture
+def host_timezone(monkeypatch):
+    def configure(name):
+        monkeypatch.setenv('TZ', name)
+        time.tzset()
+        normalize_date.cache_clear()
+
+    yield configure
+    monkeypatch.undo()
+    time.tzset()
+    normalize_date.cache_clear()
+
+def test_naive_timestamp_in_aex_timezone(aex_timezone):
+    aex_timezone('UTC')
+    assert normalize_date('2024-05-01 10:00:00') == Date('2024-05-01', 1714557600000)
+
+    aex_timezone('Africa/Johannesburg')
+    assert normalize_date('2024-05-01 10:00:00') == Date('2024-05-01', 1714550400000)
+
+def test_naive_timestamp_defaults_to_host_local_time(aex_timezone, host_timezone):
+    aex_timezone(None)
+    host_timezone('Africa/Johannesburg')
+    assert normalize_date('2024-05-01 10:00:00') == Date('2024-05-01', 1714550400000)
+
+def test_offset_keeps_its_calendar_day(aex_timezone):
+    aex_timezone('UTC')
+    assert normalize_date('2024-05-01T23:30:00-05:00') == Date('2024-05-01', 1714624200000)
+    assert normalize_date('2024-05-01T10:00:00Z') == Date('2024-05-01', 1714557600000)
+
+def test_epoch_seconds_and_milliseconds(aex_timezone):
+    aex_timezone('UTC')
+    assert normalize_date(1714557600) == Date('2024-05-01', 1714557600000)
+    assert normalize_date(1714557600000) == Date('2024-05-01', 1714557600000)
+
+def test_date_only(aex_timezone):
+    aex_timezone('UTC')
+    assert normalize_date('2024-05-01') == Date('2024-05-01', 1714521600000)
+
+@pytest.mark.parametrize("value", [None, '', 'not a date', 0, True])
+def test_missing_or_invalid(value):
+    assert normalize_date(value) == EMPTY_DATE
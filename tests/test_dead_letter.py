@@ -0,0 +1,52 @@
+import hub
+import dead_letter
+import property_diff
+from models import Customer, Premise, WorkOrder
+
+TICKET = {"properties": {"work_order_id1": "501", "subject": "1 Main St - new order"}}
+
+def test_record_and_resolve(workdir):
+    dead_letter.record_failure("tickets", "create", 501, TICKET, "Timeout")
+    dead_letter.record_failure("tickets", "create", 501, TICKET, "Timeout")
+    entries = dead_letter.list_entries()
+    assert [(entry['record_key'], entry['attempts']) for entry in entries] == [("501", 2)]
+
+    dead_letter.resolve("tickets", "create", "501")
+    assert dead_letter.list_entries() == []
+
+def test_replay_creates_and_records_the_push(fake_hubspot):
+    dead_letter.record_failure("tickets", "create", 501, TICKET, "Timeout", 504)
+
+    assert dead_letter.replay(hub.get_hubspot_headers(), base_delay=0) == (1, 0)
+    assert dead_letter.list_entries() == []
+    ticket_id = hub.ticket_ids["501"]
+    assert fake_hubspot.api.objects["tickets"][ticket_id]["subject"] == "1 Main St - new order"
+    assert property_diff.load_pushed_properties()[f"tickets:{ticket_id}"]["work_order_id1"] == "501"
+
+def test_replay_does_not_duplicate_a_create_that_went_through(fake_hubspot):
+    # The create timed out on our side, but HubSpot made the ticket
+    status, existing = fake_hubspot.api.create("tickets", {}, TICKET)
+    dead_letter.record_failure("tickets", "create", 501, TICKET, "Timeout")
+
+    assert dead_letter.replay(hub.get_hubspot_headers(), base_delay=0) == (1, 0)
+    assert len(fake_hubspot.api.objects["tickets"]) == 1
+    assert hub.ticket_ids["501"] == existing["id"]
+    assert dead_letter.list_entries() == []
+
+def test_finding_the_ticket_resolves_its_create(fake_hubspot):
+    fake_hubspot.api.create("tickets", {}, TICKET)
+    dead_letter.record_failure("tickets", "create", 501, TICKET, "Timeout")
+
+    work_order = WorkOrder(id=501, service_id=9, status="new order")
+    premise = Premise(id=1, street_number="1", street_name="Main St", customer=Customer(id=3))
+    hub.create_or_update_tickets_for_contact("7", work_order, {"types": []}, premise, premise.customer, {}, hub.load_sales_rep_data())
+
+    assert dead_letter.list_entries() == []
+    assert len(fake_hubspot.api.objects["tickets"]) == 1
+
+def test_replay_updates(fake_hubspot):
+    status, ticket = fake_hubspot.api.create("tickets", {}, TICKET)
+    dead_letter.record_failure("tickets", "update", ticket["id"], {"properties": {"subject": "changed"}}, "Server error", 500)
+
+    assert dead_letter.replay(hub.get_hubspot_headers(), base_delay=0) == (1, 0)
+    assert fake_hubspot.api.objects["tickets"][ticket["id"]]["subject"] == "changed"
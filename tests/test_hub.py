@@ -0,0 +1,26 @@
+import hub
+from dates import normalize_date
+from models import Premise
+
+def _premise(premise_id, service_updated_at=None):
+    return Premise(premise_id, service_updated_at=normalize_date(service_updated_at))
+
+def test_primary_premise_has_the_most_recent_service_update():
+    premises = [
+        _premise(1, "2024-05-01T10:00:00+00:00"),
+        _premise(2, "2024-06-01T10:00:00+00:00"),
+        _premise(3, "2024-03-01T10:00:00+00:00"),
+    ]
+    assert hub.select_primary_premise(premises).id == 2
+
+def test_primary_premise_prefers_a_dated_premise():
+    premises = [_premise(1, "2024-05-01T10:00:00+00:00"), _premise(2)]
+    assert hub.select_primary_premise(premises).id == 1
+
+def test_primary_premise_ties_go_to_the_last():
+    assert hub.select_primary_premise([_premise(1), _premise(2)]).id == 2
+    dated = "2024-05-01T10:00:00+00:00"
+    assert hub.select_primary_premise([_premise(1, dated), _premise(2, dated)]).id == 2
+
+def test_single_premise_is_primary():
+    assert hub.select_primary_premise([_premise(1)]).id == 1
@@ -0,0 +1,9 @@
+import hub
+import prem
+import reconcile
+import dead_letter
+import hubspot_api
+
+def test_hubspot_modules_share_one_session():
+    for module in (hub, prem, dead_letter, reconcile):
+        assert module.session is hubspot_api.session
@@ -0,0 +1,90 @@
+import time
+import queue
+import threading
+
+import pytest
+import requests
+
+import ingest
+
+EVENT = {"type": "premise", "id": 1}
+
+def _post(server, headers=None):
+    return requests.post(f"http://127.0.0.1:{server.server_address[1]}/events", json=EVENT, headers=headers)
+
+@pytest.fixture
+def receiver():
+    servers = []
+
+    def start(secret=None):
+        events = queue.Queue()
+        server = ingest.start_receiver(events, port=0, host="127.0.0.1", secret=secret)
+        servers.append(server)
+        return server, events
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_other_interfaces_need_a_secret():
+    with pytest.raises(Exception, match="INGEST_SECRET"):
+        ingest.start_receiver(queue.Queue(), port=0, host="0.0.0.0", secret=None)
+
+def test_secret_is_required_when_set(receiver):
+    server, events = receiver(secret="s3cret")
+    assert _post(server).status_code == 401
+    assert _post(server, {"X-Ingest-Secret": "wrong"}).status_code == 401
+    assert events.empty()
+
+    assert _post(server, {"X-Ingest-Secret": "s3cret"}).status_code == 202
+    assert events.get_nowait() == EVENT
+
+def test_safety_net_poll_runs_during_a_steady_stream_of_events(workdir, monkeypatch):
+    events = queue.Queue()
+    stop_event = threading.Event()
+    polls = []
+
+    def poll(updated_after, sales_rep_data, ticket_types):
+        polls.append(updated_after)
+        stop_event.set()
+        return updated_after
+
+    monkeypatch.setattr(ingest, 'BATCH_WINDOW_SECONDS', 0.05)
+    monkeypatch.setattr(ingest, 'resolve_premise_id', lambda event, fetched_services=None: event['id'])
+    monkeypatch.setattr(ingest, 'sync_premises', lambda premise_ids, sales_rep_data, ticket_types, fetched_services=None: len(premise_ids))
+    monkeypatch.setattr(ingest.daemon, 'poll', poll)
+
+    def feed():
+        while not stop_event.is_set():
+            events.put(EVENT)
+            time.sleep(0.01)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    worker = threading.Thread(target=ingest.run_worker, args=(events, stop_event, 0.0001), daemon=True)
+    worker.start()
+    worker.join(timeout=5)
+    stop_event.set()
+
+    assert polls, "the poll never ran while events kept arriving"
+
+def test_batch_is_deduplicated_and_reuses_fetched_services(snapshot, fake_aex, fake_hubspot, monkeypatch):
+    monkeypatch.setattr(ingest.associations, 'SYNC_ASSOCIATIONS', False)
+    first, second = snapshot[0], snapshot[1]
+    service_id = second['services'][0]['service_details']['full_service']['service']['id']
+    batch = [
+        {"type": "premise", "id": first['id']},
+        {"type": "premise", "id": str(first['id'])},
+        {"type": "service", "id": service_id},
+    ]
+
+    fetched_services = {}
+    premise_ids = ingest.resolve_premise_ids(batch, fetched_services)
+    assert premise_ids == [str(first['id']), str(second['id'])]
+    assert list(fetched_services) == [str(service_id)]
+
+    synced = ingest.sync_premises(premise_ids, ingest.hub.load_sales_rep_data(), ingest.hub.load_ticket_types(), fetched_services)
+    assert synced == 2
+    services = len(first['services']) + len(second['services'])
+    assert fake_aex.stats.calls["GET /services/{id}/full"] == services
@@ -0,0 +1,63 @@
+import json
+import copy
+
+import pytest
+
+import models
+from dates import EMPTY_DATE, normalize_date
+
+# A record and the records it holds, as nested dicts, for comparing parses
+def _as_dict(value):
+    if isinstance(value, (models.Premise, models.Service, models.WorkOrder, models.Customer)):
+        return {name: _as_dict(getattr(value, name)) for name in type(value).__slots__}
+    if isinstance(value, tuple) and not hasattr(value, '_fields'):
+        return [_as_dict(item) for item in value]
+    return value
+
+def test_parse_premises_keeps_every_field_of_the_snapshot(snapshot):
+    premises = models.parse_premises(snapshot)
+    assert len(premises) == len(snapshot)
+
+    for premise, raw in zip(premises, snapshot):
+        assert (premise.id, premise.customer_id, premise.address, premise.city) == \
+            (raw['id'], raw['customer_id'], f"{raw['street_number']} {raw['street_name']}", raw['city'])
+        assert premise.updated_at == normalize_date(raw['updated_at'])
+        assert premise.customer.email == raw['customer']['customer_details']['email']
+
+        assert len(premise.services) == len(raw['services'])
+        for service, raw_service in zip(premise.services, raw['services']):
+            full_service = raw_service['service_details']['full_service']
+            assert (service.id, service.product_name) == (full_service['service']['id'], full_service['isp_product']['name'])
+            assert [work_order.id for work_order in service.work_orders] == [item['id'] for item in raw_service['work_orders']['items']]
+            for work_order, item in zip(service.work_orders, raw_service['work_orders']['items']):
+                assert work_order.status == item['status'].strip().lower()
+                assert work_order.completed_date == normalize_date(item.get('completed_date'))
+
+        assert premise.product == premise.services[0].product_name
+        assert premise.service_updated_at == premise.services[0].updated_at
+
+def test_records_have_no_instance_dict(snapshot):
+    premise = models.parse_premises(snapshot)[0]
+    for record in (premise, premise.customer, premise.services[0], premise.services[0].work_orders[0]):
+        assert not hasattr(record, '__dict__')
+        with pytest.raises(AttributeError):
+            record.unknown_field = 1
+
+def test_parsing_again_passes_records_through_and_saved_snapshots_parse_the_same(snapshot):
+    premises = models.parse_premises(snapshot)
+    assert all(again is premise for again, premise in zip(models.parse_premises(premises), premises))
+
+    reloaded = models.parse_premises(json.loads(json.dumps(snapshot)))
+    assert [_as_dict(premise) for premise in reloaded] == [_as_dict(premise) for premise in premises]
+
+def test_invalid_services_are_skipped_and_do_not_set_the_product(snapshot):
+    raw = copy.deepcopy(snapshot[0])
+    raw['services'][0]['work_orders'] = None
+    premise = models.parse_premises([raw, None])[0]
+
+    assert len(premise.services) == len(raw['services']) - 1
+    assert premise.product == raw['services'][1]['service_details']['full_service']['isp_product']['name']
+
+    raw['services'] = "not a list"
+    premise = models.Premise.from_dict(raw)
+    assert (premise.services, premise.product, premise.service_updated_at) == (None, '', EMPTY_DATE)
@@ -0,0 +1,32 @@
+import io
+import time
+import contextlib
+
+import pytest
+
+import data
+import planner
+
+UPDATED_AFTER = "2020-01-01 00:00:00"
+
+@pytest.mark.parametrize("total, pages", [(0, 1), (99, 1), (100, 1), (101, 2), (300, 3)])
+def test_page_requests_follow_the_paging_loop(total, pages):
+    assert planner._page_requests(total, 100) == pages
+
+def test_work_order_pages_match_the_fetch(fake_aex, monkeypatch):
+    monkeypatch.setattr(data, 'PAGE_SIZE', 3)
+    monkeypatch.setattr(data, 'ENRICHMENT_STRATEGY', 'bulk')
+    with contextlib.redirect_stdout(io.StringIO()):
+        enriched = data.fetch_and_enrich(UPDATED_AFTER)
+    time.sleep(0.1)  # the fake records a call after writing its response
+    fetched_pages = fake_aex.stats.calls["GET /work-orders"]
+    assert planner.plan_snapshot(enriched).calls[("aex", "GET /premises")] == fake_aex.stats.calls["GET /premises"]
+
+    # The sweep also returns work orders of premises outside the snapshot, which its own
+    # count cannot see; the sweep's total can
+    partial = enriched[:len(enriched) // 2]
+    assert planner.plan_snapshot(partial).calls[("aex", "GET /work-orders")] < fetched_pages
+    with contextlib.redirect_stdout(io.StringIO()):
+        total = planner.fetch_work_orders_total(data.HOURS)
+    plan = planner.plan_snapshot(partial, work_orders_total=total)
+    assert plan.calls[("aex", "GET /work-orders")] == fetched_pages
@@ -0,0 +1,50 @@
+import pytest
+
+import property_diff
+from property_diff import changed_properties, diff_properties, record_pushed, values_differ
+
+PROPERTIES = {"firstname": "Jane", "lastname": "Doe", "aex_id": 5}
+
+def test_cache_miss_sends_full_payload(workdir, monkeypatch):
+    monkeypatch.setattr(property_diff, 'PATCH_MODE', 'cache')
+    assert changed_properties("contacts", "101", PROPERTIES) == PROPERTIES
+
+def test_cache_hit_sends_only_changes(workdir, monkeypatch):
+    monkeypatch.setattr(property_diff, 'PATCH_MODE', 'cache')
+    record_pushed("contacts", "101", {"firstname": "Jane", "lastname": "Smith", "aex_id": 5})
+    assert changed_properties("contacts", "101", PROPERTIES) == {"lastname": "Doe"}
+
+def test_full_mode_sends_everything(workdir, monkeypatch):
+    monkeypatch.setattr(property_diff, 'PATCH_MODE', 'full')
+    record_pushed("contacts", "101", PROPERTIES)
+    assert changed_properties("contacts", "101", PROPERTIES) == PROPERTIES
+
+@pytest.mark.parametrize("outgoing, current", [
+    ("Durban", "Durban"),
+    (" Durban ", "Durban"),
+    (None, ""),
+    (True, "true"),
+    (5, "5"),
+    (5.0, "5"),
+    # Datetime properties are sent as epoch milliseconds and read back as ISO strings
+    (1714557600000, "2024-05-01T10:00:00.000Z"),
+    (1714557600000, "2024-05-01T12:00:00+02:00"),
+])
+def test_values_equal_after_normalizing(outgoing, current):
+    assert not values_differ(outgoing, current)
+
+@pytest.mark.parametrize("outgoing, current", [
+    ("Durban", "Cape Town"),
+    ("durban", "Durban"),
+    (False, "true"),
+    (5.5, "5"),
+    (1714557600000, "2024-05-01T10:00:01.000Z"),
+    (1714557600000, "not a date T"),
+])
+def test_values_differ(outgoing, current):
+    assert values_differ(outgoing, current)
+
+def test_diff_properties_keeps_changed_and_unknown_properties():
+    outgoing = {"city": "Durban", "aex_id": 5, "closed_date": 1714557600000, "province": "KZN"}
+    current = {"city": "Cape Town", "aex_id": "5", "closed_date": "2024-05-01T10:00:00.000Z"}
+    assert diff_properties(outgoing, current) == {"city": "Durban", "province": "KZN"}
@@ -0,0 +1,68 @@
+import io
+import contextlib
+
+import hub
+import data
+import reconcile
+
+UPDATED_AFTER = "2020-01-01 00:00:00"
+
+def test_plan_corrections_matches_by_key_and_diffs():
+    expected = {
+        "1": {"aex_id": 1, "email": "a@example.com", "city": "Durban"},
+        "2": {"aex_id": 2, "email": "b@example.com", "city": "Cape Town"},
+        "3": {"aex_id": 3, "email": "c@example.com", "city": "Pretoria"},
+    }
+    current = {
+        "101": {"aex_id": "1", "email": "a@example.com", "city": "Durban"},
+        "102": {"aex_id": "2", "email": "b@example.com", "city": "Johannesburg"},
+        "199": {"aex_id": "9", "email": "z@example.com", "city": "Durban"},
+    }
+
+    plan = reconcile.plan_corrections("contacts", expected, current)
+
+    assert plan["matched"] == {"1": "101", "2": "102"}
+    assert plan["updates"] == [("2", "102", {"city": "Cape Town"})]
+    assert plan["creates"] == [("3", expected["3"])]
+    assert plan["extra"] == ["199"]
+
+def test_contacts_match_on_email_case_insensitively():
+    # HubSpot stores contact emails lowercased
+    expected = {"5": {"aex_id": 5, "email": " Jane.Doe@Example.com", "city": "Durban"}}
+    current = {"105": {"aex_id": "", "email": "jane.doe@example.com", "city": "Durban"}}
+
+    plan = reconcile.plan_corrections("contacts", expected, current)
+
+    assert plan["creates"] == []
+    assert plan["matched"] == {"5": "105"}
+    # The email only differs in case, so it is not rewritten on every reconcile
+    assert plan["updates"] == [("5", "105", {"aex_id": 5})]
+
+def test_tickets_do_not_match_on_email():
+    expected = {"7": {"work_order_id1": 7, "email": "a@example.com"}}
+    current = {"201": {"work_order_id1": "8", "email": "a@example.com"}}
+
+    plan = reconcile.plan_corrections("tickets", expected, current)
+
+    assert plan["creates"] == [("7", expected["7"])]
+
+def _fetch(keep_all, monkeypatch):
+    monkeypatch.setattr(data, 'KEEP_ALL_WORK_ORDERS', keep_all)
+    with contextlib.redirect_stdout(io.StringIO()):
+        return data.fetch_and_enrich(UPDATED_AFTER)
+
+def test_full_fetch_reports_tickets_of_cancelled_work_orders(fake_aex, fake_hubspot, monkeypatch):
+    hub.process_premises_for_hubspot(_fetch(False, monkeypatch))
+    ticketed = next(work_order for work_order in fake_aex.api.work_orders
+                    if str(work_order['id']) in hub.ticket_ids)
+    ticketed['status'] = 'Cancelled'
+
+    # A regular fetch leaves the cancelled work order out, so its ticket looks unknown
+    summary = reconcile.reconcile(_fetch(False, monkeypatch), dry_run=True)
+    assert summary["tickets"]["no_ticket_stage"] == 0
+    extra = summary["tickets"]["only_in_hubspot"]
+    assert extra >= 1
+
+    summary = reconcile.reconcile(_fetch(True, monkeypatch), dry_run=True)
+    assert summary["tickets"]["no_ticket_stage"] == 1
+    assert summary["tickets"]["only_in_hubspot"] == extra - 1
@@ -0,0 +1,93 @@
+import io
+import json
+import contextlib
+
+import hub
+import data
+import tracing
+import models
+
+UPDATED_AFTER = "2020-01-01 00:00:00"
+
+def _read_spans(filename):
+    spans = []
+    with open(filename) as trace_file:
+        for line in trace_file:
+            request = json.loads(line)
+            for resource_spans in request["resourceSpans"]:
+                for scope_spans in resource_spans["scopeSpans"]:
+                    spans.extend(scope_spans["spans"])
+    return spans
+
+def _attributes(span):
+    return {item["key"]: next(iter(item["value"].values())) for item in span["attributes"]}
+
+def test_every_pushed_premise_has_its_own_trace(fake_aex, fake_hubspot, workdir, monkeypatch):
+    with contextlib.redirect_stdout(io.StringIO()):
+        premises = models.parse_premises(data.fetch_and_enrich(UPDATED_AFTER))
+    shared = [group for group in hub.group_premises_by_customer(premises) if len(group) > 1]
+    assert shared, "the snapshot should have customers with several premises"
+
+    trace_file = workdir / "traces.jsonl"
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(trace_file))
+    hub.process_premises_for_hubspot(premises)
+
+    roots = {}
+    for span in _read_spans(trace_file):
+        if "parentSpanId" not in span:
+            roots.setdefault(str(_attributes(span).get("premise_id")), []).append(span)
+    for premise in premises:
+        assert str(premise.id) in roots
+    for group in shared:
+        primary = hub.select_primary_premise(group)
+        for premise in group:
+            names = {span["name"] for span in roots[str(premise.id)]}
+            assert names == ({"hubspot.push_customer"} if premise is primary else {"hubspot.push_premise_tickets"})
+
+def test_nested_spans_export_parent_ids_and_errors(workdir, monkeypatch):
+    trace_file = workdir / "traces.jsonl"
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(trace_file))
+    try:
+        with tracing.premise_span("outer", 42):
+            with tracing.span("inner", service_id=7):
+                raise ValueError("boom")
+    except ValueError:
+        pass
+
+    inner, outer = _read_spans(trace_file)
+    assert (outer["name"], inner["name"]) == ("outer", "inner")
+    assert "parentSpanId" not in outer
+    assert inner["parentSpanId"] == outer["spanId"]
+    assert inner["traceId"] == outer["traceId"]
+    # OTLP/JSON carries integers as strings
+    assert outer["attributes"] == [{"key": "premise_id", "value": {"intValue": "42"}}]
+    assert _attributes(inner) == {"service_id": "7"}
+    assert inner["status"] == {"code": tracing.STATUS_ERROR, "message": "ValueError: boom"}
+    assert outer["status"]["code"] == tracing.STATUS_ERROR
+
+def test_enrichment_spans_nest_under_the_premise_trace(fake_aex, fake_hubspot, workdir, monkeypatch):
+    trace_file = workdir / "traces.jsonl"
+    monkeypatch.setattr(tracing, 'TRACE_FILE', str(trace_file))
+    with contextlib.redirect_stdout(io.StringIO()):
+        premises = models.parse_premises(data.fetch_and_enrich(UPDATED_AFTER))
+        hub.process_premises_for_hubspot(premises)
+
+    spans = _read_spans(trace_file)
+    assert {"aex.fetch_services", "aex GET", "hubspot POST"} <= {span["name"] for span in spans}
+    by_id = {span["spanId"]: span for span in spans}
+    roots = {}
+    for span in spans:
+        if "parentSpanId" in span:
+            parent = by_id[span["parentSpanId"]]
+            assert span["traceId"] == parent["traceId"]
+            if span["name"] == "aex.fetch_services":
+                assert parent["name"] == "aex.enrich_premise"
+            if span["name"] == "aex GET":
+                assert parent["name"].startswith("aex.fetch_")
+        else:
+            roots.setdefault(span["name"], {})[str(_attributes(span).get("premise_id"))] = span
+
+    # Enrichment and push of one premise land in the same trace
+    assert set(roots["aex.enrich_premise"]) == {str(premise.id) for premise in premises}
+    for premise_id, push_span in {**roots["hubspot.push_customer"], **roots.get("hubspot.push_premise_tickets", {})}.items():
+        assert push_span["traceId"] == roots["aex.enrich_premise"][premise_id]["traceId"]
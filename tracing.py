@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import hashlib
+import inspect
+import threading
+import functools
+from urllib.parse import urlsplit
+
+# Lightweight tracing for the sync pipeline. Each premise gets a span per phase
+# (enrichment, contact/ticket push, premises push) with child spans for the AEX
+# fetches, payload builds and HubSpot calls made for it. All spans for one premise
+# share a trace ID, so a slow premise can be followed from fetch to push.
+#
+# Finished traces are appended to a JSON-lines file, one OTLP/JSON
+# ExportTraceServiceRequest per line, which the OpenTelemetry Collector's file
+# receiver (and most trace viewers) can read. Tracing is off unless TRACE_FILE is
+# set or configure() is called, and costs a single check per call when off.
+
+# JSON-lines file spans are exported to (None disables tracing)
+TRACE_FILE = os.getenv('TRACE_FILE') or None
+
+# service.name resource attribute on exported spans
+SERVICE_NAME = "premise-flow"
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# Premise trace IDs are derived from this, so they are unique per process
+_run_id = os.urandom(8).hex()
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+# Turn tracing on (or off with None) and set the file spans are exported to
+def configure(filename):
+    global TRACE_FILE
+    TRACE_FILE = filename or None
+
+def enabled():
+    return TRACE_FILE is not None
+
+def _stack():
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+        _local.finished = []
+    return stack
+
+def _new_id(length):
+    return os.urandom(length).hex()
+
+def _trace_id_for(trace_key):
+    return hashlib.sha256(f"{_run_id}:{trace_key}".encode()).hexdigest()[:32]
+
+# An attribute value in OTLP/JSON form
+def _attribute_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    __slots__ = ("name", "kind", "trace_key", "attributes", "trace_id", "span_id", "parent_span_id",
+                 "start_time", "end_time", "status_code", "status_message")
+
+    def __init__(self, name, attributes=None, trace_key=None, kind=SPAN_KIND_INTERNAL):
+        self.name = name
+        self.kind = kind
+        self.trace_key = trace_key
+        self.attributes = {key: value for key, value in (attributes or {}).items() if value is not None}
+        self.trace_id = None
+        self.span_id = _new_id(8)
+        self.parent_span_id = None
+        self.start_time = None
+        self.end_time = None
+        self.status_code = STATUS_OK
+        self.status_message = None
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_error(self, message):
+        self.status_code = STATUS_ERROR
+        self.status_message = str(message)[:500]
+
+    def __enter__(self):
+        stack = _stack()
+        parent = stack[-1] if stack else None
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            self.parent_span_id = parent.span_id
+        elif self.trace_key is not None:
+            self.trace_id = _trace_id_for(self.trace_key)
+        else:
+            self.trace_id = _new_id(16)
+        stack.append(self)
+        self.start_time = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.end_time = time.time_ns()
+        if exc is not None:
+            self.set_error(f"{exc_type.__name__}: {exc}")
+        _stack().pop()
+        _finish(self)
+        return False
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_time),
+            "endTimeUnixNano": str(self.end_time),
+            "attributes": [{"key": key, "value": _attribute_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status_code},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+# Stand-in returned while tracing is off, so call sites need no checks of their own
+class _NoopSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_error(self, message):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+_NOOP_SPAN = _NoopSpan()
+
+# Collect a finished span; once its root span ends, the whole trace is written out
+def _finish(span):
+    _stack()
+    _local.finished.append(span)
+    if not _local.stack:
+        finished, _local.finished = _local.finished, []
+        _export(finished)
+
+def _export(spans):
+    filename = TRACE_FILE
+    if filename is None:
+        return
+    request = {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": "premise-flow.tracing"},
+                "spans": [span.to_otlp() for span in spans],
+            }],
+        }]
+    }
+    line = json.dumps(request, default=str)
+    with _write_lock:
+        with open(filename, 'a') as trace_file:
+            trace_file.write(line + "\n")
+
+# Open a span as a child of the current one (or as a new trace)
+def span(name, trace_key=None, **attributes):
+    if TRACE_FILE is None:
+        return _NOOP_SPAN
+    return Span(name, attributes, trace_key)
+
+# Open a span for one phase of a premise's sync; all phases of a premise share a trace
+def premise_span(name, premise_id, **attributes):
+    return span(name, trace_key=f"premise:{premise_id}", premise_id=premise_id, **attributes)
+
+# The innermost open span on this thread
+def current_span():
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else _NOOP_SPAN
+
+# Look up an attribute from a function's arguments: "premise_id", or "work_order.id"
+# for a field of a record (or key of a dict) argument
+def _resolve_argument(arguments, path):
+    name, _, key = path.partition('.')
+    value = arguments.get(name)
+    if key:
+        value = value.get(key) if isinstance(value, dict) else getattr(value, key, None)
+    return value if isinstance(value, (str, int, float, bool)) else None
+
+# Decorator wrapping each call in a span. Keyword arguments name the span attributes
+# and where to read them from, e.g. @traced("aex.fetch_services", premise_id="premise_id")
+def traced(name, **attribute_paths):
+    def decorator(function):
+        signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if TRACE_FILE is None:
+                return function(*args, **kwargs)
+            arguments = signature.bind_partial(*args, **kwargs).arguments
+            attributes = {key: _resolve_argument(arguments, path) for key, path in attribute_paths.items()}
+            with Span(name, attributes):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+# Record every HTTP response on a requests session as a client span under the current span.
+# Each attempt (including 429s and other retries) gets its own span.
+def instrument_session(session, peer):
+    def record_response(response, *args, **kwargs):
+        if TRACE_FILE is None:
+            return
+        end_time = time.time_ns()
+        request = response.request
+        url = urlsplit(request.url)
+        client_span = Span(f"{peer} {request.method}", {
+            "peer.service": peer,
+            "http.request.method": request.method,
+            "server.address": url.hostname,
+            "url.path": url.path,
+            "http.response.status_code": response.status_code,
+        }, kind=SPAN_KIND_CLIENT)
+
+        parent = current_span()
+        if isinstance(parent, Span):
+            client_span.trace_id = parent.trace_id
+            client_span.parent_span_id = parent.span_id
+        else:
+            client_span.trace_id = _new_id(16)
+        client_span.start_time = end_time - int(response.elapsed.total_seconds() * 1e9)
+        client_span.end_time = end_time
+        if response.status_code >= 400:
+            client_span.set_error(f"HTTP {response.status_code}")
+        _finish(client_span)
+
+    session.hooks['response'].append(record_response)